@@ -0,0 +1,315 @@
+"""
+DRAFT IMSS 2026 - Benchmark de sesiones concurrentes
+Carga simulada de draft_imss_app.py contra el Sheets simulado (sin red)
+
+INSTRUCCIONES:
+    pip install -r requirements.txt
+    python bench_draft_imss.py
+    python bench_draft_imss.py --filas 50,1000,20000 --sesiones 16 --acciones 30
+    python bench_draft_imss.py --max-p95-ms 400 --max-llamadas-sesion 20 --json bench.json
+
+    Cada tamano de hoja Plazas corre en un proceso aparte (cachés y memoria
+    limpias). En el proceso, N sesiones de AppTest corren en hilos a la vez y
+    hacen una secuencia reproducible de acciones: filtrar, cambiar de zona,
+    buscar, paginar y (las sesiones normativas) guardar. Reporta latencia de
+    rerun p50/p95/p99, llamadas a Sheets por sesion y memoria por sesion.
+    Con umbrales (--max-*) termina con codigo 1 si alguno se excede, para CI.
+
+    AppTest no es seguro entre hilos (cada run instala su propio Runtime), asi
+    que los reruns de las sesiones se turnan con un candado. El rerun de la app
+    es trabajo de CPU y en el servidor real tambien compite por el GIL, por eso
+    la latencia "con espera" (turno + rerun) aproxima lo que ve un usuario con
+    N sesiones activas; "rerun" es solo el tiempo de ejecucion del script.
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from draft_imss_datos import ESPECIALIDADES_MUESTRA
+
+APP = str(Path(__file__).with_name("draft_imss_app.py"))
+
+# Un solo AppTest ejecutando a la vez (ver INSTRUCCIONES)
+_turno = threading.Lock()
+
+# Peso relativo de cada accion en la secuencia de una sesion
+ACCIONES = {
+    "filtrar_zona": 3,
+    "tipo": 2,
+    "solo_disponibles": 1,
+    "ir_a_zona": 2,
+    "buscar": 3,
+    "cargar_mas": 1,
+    "guardar": 2,
+    "refrescar": 2,
+}
+
+
+# -----------------------------------------------
+# SESION SIMULADA
+# -----------------------------------------------
+
+def instalar_secrets(opciones):
+    """Fija st.secrets para todo el proceso.
+
+    AppTest.secrets reemplaza st.secrets (global) durante cada run y lo restaura al
+    terminar, lo que no es seguro con varias sesiones corriendo en hilos a la vez.
+    """
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+
+    st.secrets = Secrets()
+    st.secrets._secrets = dict(opciones)
+
+
+def nueva_sesion():
+    from streamlit.testing.v1 import AppTest
+
+    return AppTest.from_file(APP, default_timeout=120)
+
+
+def _boton(at, texto=None, key=None):
+    for b in at.button:
+        if (key is not None and b.key == key) or (texto is not None and texto in b.label):
+            return b
+    return None
+
+
+def _accion(at, nombre, rnd, normativo, rerun):
+    """Aplica una accion sobre los widgets; retorna False si no aplica en el estado actual."""
+    if nombre == "filtrar_zona":
+        # Tras ir_a_zona la pestaña Plazas muestra el filtro de navegacion en lugar del multiselect
+        if not at.multiselect:
+            quitar = _boton(at, texto="Quitar filtro")
+            if quitar is None:
+                return False
+            quitar.click()
+            rerun()
+        opciones = at.multiselect[0].options
+        at.multiselect[0].set_value(rnd.sample(opciones, k=min(len(opciones), rnd.randint(0, 2))))
+    elif nombre == "tipo":
+        at.selectbox[0].set_value(rnd.choice(["Ambas", "Definitivas", "Interinas"]))
+    elif nombre == "solo_disponibles":
+        at.checkbox[0].set_value(not at.checkbox[0].value)
+    elif nombre == "ir_a_zona":
+        botones = [b for b in at.button if (b.key or "").startswith("zbtn_")]
+        if not botones:
+            return False
+        rnd.choice(botones).click()
+    elif nombre == "buscar":
+        # Prefijos de nombres reales y, de vez en cuando, una consulta sin resultados
+        especialidad = rnd.choice(ESPECIALIDADES_MUESTRA + ["xyz"])
+        at.text_input(key="filtro_esp").input(especialidad[:rnd.randint(3, len(especialidad))].lower())
+    elif nombre == "cargar_mas":
+        boton = _boton(at, key="plazas_mas")
+        if boton is None:
+            return False
+        boton.click()
+    elif nombre == "guardar":
+        if not normativo:
+            return False
+        zona = at.selectbox(key="n_zona")
+        zona.set_value(rnd.choice(zona.options))
+        rerun()
+        especialidad = at.selectbox(key="n_espec")
+        especialidad.set_value(rnd.choice(especialidad.options))
+        rerun()
+        n_def = at.number_input(key="n_def")
+        n_def.set_value(rnd.randint(0, int(n_def.max)))
+        _boton(at, texto="Guardar").click()
+    return True
+
+
+def correr_sesion(acciones, semilla, normativo, latencias, errores):
+    """Una sesion completa; agrega (rerun, con_espera) de cada rerun a `latencias`.
+
+    Una excepcion del propio benchmark (un widget que no esta donde se esperaba)
+    termina la sesion y queda en `errores`, para que cuente como falla.
+    """
+    rnd = random.Random(semilla)
+    at = nueva_sesion()
+
+    def rerun():
+        pedido = time.perf_counter()
+        with _turno:
+            inicio = time.perf_counter()
+            at.run()
+            fin = time.perf_counter()
+        latencias.append((fin - inicio, fin - pedido))
+        if at.exception:
+            errores.append(at.exception[0].message)
+
+    nombres, pesos = list(ACCIONES), list(ACCIONES.values())
+    hechas, nombre = 0, "inicio"
+    try:
+        rerun()
+        if normativo:
+            at.text_input(key="pwd_input").input("draft2026")
+            _boton(at, texto="Ingresar").click()
+            rerun()
+
+        while hechas < acciones:
+            nombre = rnd.choices(nombres, pesos)[0]
+            if _accion(at, nombre, rnd, normativo, rerun):
+                rerun()
+                hechas += 1
+    except Exception as e:
+        errores.append(f"sesion {semilla}, {nombre} (accion {hechas + 1}): {type(e).__name__}: {e}")
+    return at
+
+
+# -----------------------------------------------
+# UN TAMANO DE HOJA (proceso aparte)
+# -----------------------------------------------
+
+def medir_tamano(filas, sesiones, acciones, latencia_ms, semilla, sesiones_memoria):
+    """Corre el escenario para una hoja de `filas` renglones y retorna sus metricas."""
+    import draft_imss_datos as datos
+
+    id_libro = f"bench-{filas}"
+    instalar_secrets({"backend": "fake", "fake_id": id_libro, "fake_filas": filas, "fake_latencia_ms": latencia_ms})
+
+    # Arranque en frio: primera sesion del proceso (carga y agregados del snapshot)
+    inicio = time.perf_counter()
+    nueva_sesion().run()
+    arranque = time.perf_counter() - inicio
+
+    libro = datos.LIBROS_SIMULADOS[id_libro]
+    libro.llamadas.clear()
+
+    latencias, errores = [], []
+    hilos = [
+        threading.Thread(target=correr_sesion,
+                         args=(acciones, semilla + i, i % 4 == 0, latencias, errores))
+        for i in range(sesiones)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    llamadas = dict(libro.llamadas)
+
+    # Memoria: crecimiento del heap de Python al abrir sesiones adicionales ya con datos en cache
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    vivas = [correr_sesion(3, semilla + 1000 + i, False, [], errores) for i in range(sesiones_memoria)]
+    memoria = (tracemalloc.get_traced_memory()[0] - base) / max(len(vivas), 1)
+    tracemalloc.stop()
+
+    rerun_ms, espera_ms = (np.array(latencias) * 1000).T
+    return {
+        "filas": filas,
+        "sesiones": sesiones,
+        "reruns": len(latencias),
+        "arranque_ms": round(arranque * 1000, 1),
+        "p50_ms": round(float(np.percentile(rerun_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(rerun_ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(rerun_ms, 99)), 1),
+        "p95_con_espera_ms": round(float(np.percentile(espera_ms, 95)), 1),
+        "reruns_por_s": round(len(latencias) / duracion, 1),
+        "llamadas_sheets": llamadas,
+        "llamadas_por_sesion": round(sum(llamadas.values()) / sesiones, 2),
+        "mb_por_sesion": round(memoria / 2**20, 2),
+        "errores": errores[:5],
+    }
+
+
+def _medir_en_proceso(cola, *args):
+    try:
+        cola.put(medir_tamano(*args))
+    except Exception as e:
+        cola.put({"filas": args[0], "errores": [f"{type(e).__name__}: {e}"]})
+
+
+def medir_aislado(*args):
+    """medir_tamano en un proceso nuevo, para no compartir cache_resource ni memoria entre tamanos."""
+    contexto = multiprocessing.get_context("spawn")
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_medir_en_proceso, args=(cola, *args))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+# -----------------------------------------------
+# REPORTE
+# -----------------------------------------------
+
+def imprimir_encabezado():
+    encabezado = (f"{'filas':>7} {'ses':>4} {'reruns':>6} {'arranque':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+                  f"{'p95+esp':>8} {'rerun/s':>8} {'sheets/ses':>10} {'MB/ses':>7}")
+    print(encabezado)
+    print("-" * len(encabezado))
+
+
+def imprimir_fila(r):
+    if "p50_ms" not in r:
+        print(f"{r['filas']:>7}  ERROR {r['errores']}")
+        return
+    print(f"{r['filas']:>7} {r['sesiones']:>4} {r['reruns']:>6} {r['arranque_ms']:>7.0f}ms "
+          f"{r['p50_ms']:>5.0f}ms {r['p95_ms']:>5.0f}ms {r['p99_ms']:>5.0f}ms {r['p95_con_espera_ms']:>6.0f}ms "
+          f"{r['reruns_por_s']:>8.1f} {r['llamadas_por_sesion']:>10.2f} {r['mb_por_sesion']:>7.2f}", flush=True)
+    if r["errores"]:
+        print(f"        excepciones en la app: {r['errores']}")
+
+
+def violaciones(resultados, args):
+    """Umbrales excedidos, como texto; vacio si todo esta dentro de los limites."""
+    fallas = []
+    for r in resultados:
+        if "p50_ms" not in r or r["errores"]:
+            fallas.append(f"{r['filas']} filas: errores {r['errores']}")
+            continue
+        if args.max_p95_ms is not None and r["p95_ms"] > args.max_p95_ms:
+            fallas.append(f"{r['filas']} filas: p95 {r['p95_ms']} ms > {args.max_p95_ms} ms")
+        if args.max_llamadas_sesion is not None and r["llamadas_por_sesion"] > args.max_llamadas_sesion:
+            fallas.append(f"{r['filas']} filas: {r['llamadas_por_sesion']} llamadas/sesion > {args.max_llamadas_sesion}")
+        if args.max_mb_sesion is not None and r["mb_por_sesion"] > args.max_mb_sesion:
+            fallas.append(f"{r['filas']} filas: {r['mb_por_sesion']} MB/sesion > {args.max_mb_sesion}")
+    return fallas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de sesiones concurrentes de draft_imss_app.py")
+    parser.add_argument("--filas", default="50,1000,5000,20000", help="tamanos de la hoja Plazas, separados por coma")
+    parser.add_argument("--sesiones", type=int, default=8, help="sesiones simultaneas por tamano")
+    parser.add_argument("--acciones", type=int, default=15, help="acciones por sesion")
+    parser.add_argument("--latencia-ms", type=float, default=0, help="latencia simulada por llamada a Sheets")
+    parser.add_argument("--semilla", type=int, default=2026)
+    parser.add_argument("--sesiones-memoria", type=int, default=4, help="sesiones extra para medir memoria")
+    parser.add_argument("--max-p95-ms", type=float, help="umbral de p95 del rerun (sin espera)")
+    parser.add_argument("--max-llamadas-sesion", type=float)
+    parser.add_argument("--max-mb-sesion", type=float)
+    parser.add_argument("--json", help="archivo donde guardar los resultados")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    imprimir_encabezado()
+    for filas in [int(f) for f in args.filas.split(",")]:
+        resultados.append(medir_aislado(filas, args.sesiones, args.acciones, args.latencia_ms,
+                                        args.semilla, args.sesiones_memoria))
+        imprimir_fila(resultados[-1])
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+    fallas = violaciones(resultados, args)
+    for falla in fallas:
+        print(f"FALLA: {falla}", file=sys.stderr)
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,27 +3,91 @@ DRAFT IMSS 2026 - Monitor de Plazas Disponibles
 Version con Google Sheets + Panel Normativo
 
 INSTRUCCIONES:
-    pip install streamlit pandas gspread google-auth
+    pip install -r requirements.txt
     python -m streamlit run draft_imss_app.py
+
+    Los datos vienen de Google Sheets; con st.secrets["backend"] = "sqlite" o
+    "fake" se usa una base local o un Sheets simulado (ver draft_imss_datos.py).
+
+    Diagnostico: en el panel Normativo con ?diag=1 en la URL se ven los tiempos
+    por seccion y las llamadas al backend (ver draft_imss_metricas.py);
+    st.secrets["metricas"] = false desactiva la medicion.
+
+    Vista publica estatica: con st.secrets["publicacion_dir"] se escriben ahi
+    index.html, plazas.json y plazas.csv cada vez que cambian los datos; un
+    servidor de archivos (nginx, caddy, python -m http.server) los sirve a los
+    candidatos y la app de Streamlit queda para el equipo normativo.
+
+    Cada snapshot bueno se guarda en .cache/snapshot_plazas.parquet
+    (st.secrets["copia_ruta"]; "" lo desactiva): al reiniciar se muestra de
+    inmediato y, si el backend no responde, se sigue mostrando con su antiguedad.
+
+    Varias delegaciones: st.secrets["delegaciones"] es una lista de tablas con
+    `nombre` y las opciones propias de cada una (spreadsheet_id, backend...), que
+    heredan las generales. Cada delegacion se refresca por separado y la vista
+    Nacional suma todas; un selector arriba de los KPIs cambia de vista.
 """
 
+import time
+
+_inicio_rerun = time.perf_counter()
+
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
+from html import escape
 import traceback
 from io import BytesIO
 import base64
+import json
+import re
+import importlib.util
+from collections import Counter
+from functools import partial, wraps
 from pathlib import Path
 
+# gspread, google-auth y openpyxl se importan dentro de las funciones que los usan:
+# un proceso que solo sirve el snapshot no paga su tiempo de importacion.
+from draft_imss_datos import (
+    BackendSheets, BackendSQLite, ErrorTransitorio, Toma, crear_backend, delegaciones_desde, leer_tabla_tomas, validar_tomas,
+)
+from draft_imss_fondo import DELEGACIONES_HILOS, ColaEscrituras, GrupoDelegaciones, PublicadorEstatico
+from draft_imss_metricas import BackendMedido, Metricas
+from draft_imss_snapshot import DELEGACION, NACIONAL, normalizar, texto_donde
+
 # -----------------------------------------------
 # CONFIGURACION
 # -----------------------------------------------
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+# Intervalos del refresco, de la cola de escrituras y de las delegaciones: ver draft_imss_fondo.py
+
+# Segundos que se muestra el resultado de un guardado en el panel Normativo
+TICKET_VISIBLE = 8
+# Con mas guardados en curso que estos (p. ej. una carga masiva) se muestra un resumen
+TICKETS_DETALLE = 5
+
+# Reporte descargable: columnas (nombre interno -> encabezado) y formatos
+COLUMNAS_REPORTE = {
+    "zona": "Zona", "especialidad": "Especialidad", "def_total": "Def.Total", "int_total": "Int.Total",
+    "def_tomadas": "Def.Tomadas", "int_tomadas": "Int.Tomadas", "def_disp": "Def.Disponibles",
+    "int_disp": "Int.Disponibles", "total_disp": "Total Disp.",
+}
+FORMATOS_REPORTE = {
+    "Excel (.xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (.csv)": ("csv", "text/csv"),
+    "Parquet (.parquet)": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Tarjetas por pagina en Plazas (st.secrets["tarjetas_por_pagina"]) y por bloque HTML enviado
+TARJETAS_POR_PAGINA = 60
+TARJETAS_POR_BLOQUE = 200
+# Copia local del ultimo snapshot bueno (st.secrets["copia_ruta"], "" la desactiva; requiere pyarrow)
+COPIA_RUTA = ".cache/snapshot_plazas.parquet"
+# Pagina estatica publica (st.secrets["publicacion_dir"]): el navegador la vuelve a pedir cada tantos segundos
+PUBLICACION_RECARGA = 60
+# Ultimos cambios que se listan (cada snapshot guarda CAMBIOS_MAX, draft_imss_snapshot.py) y cada cuanto se revisa el feed
+CAMBIOS_VISIBLES = 30
+CAMBIOS_INTERVALO = 10
 
 st.set_page_config(
     page_title="Draft IMSS 2026",
@@ -35,8 +99,7 @@ st.set_page_config(
 # -----------------------------------------------
 # CSS RESPONSIVE (mobile-first)
 # -----------------------------------------------
-st.markdown("""
-<style>
+CSS_APP = """
     html, body, [class*="css"] { font-family: 'Segoe UI', sans-serif; }
 
     /* -- Ocultar barra superior de Streamlit -- */
@@ -164,8 +227,17 @@ st.markdown("""
         .app-header h1 { font-size: 1.8rem; }
         .inst-logo-bar img { height: 56px; }
     }
-</style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def compactar_css(css):
+    """Quita comentarios y espacios sobrantes del CSS, una sola vez por proceso."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", " ".join(css.split()))
+
+
+st.markdown(f"<style>{compactar_css(CSS_APP)}</style>", unsafe_allow_html=True)
 
 
 # -----------------------------------------------
@@ -180,132 +252,523 @@ def img_to_base64(relative_path):
     return None
 
 
-def get_gsheet_client():
-    """Crea y retorna un cliente autenticado de Google Sheets."""
-    creds = Credentials.from_service_account_info(
-        dict(st.secrets["gcp_service_account"]), scopes=SCOPES
+@st.cache_resource(show_spinner=False)
+def html_logos():
+    """Barra de logos institucionales; las imagenes se leen y codifican una vez por proceso."""
+    logo_gob_b64 = img_to_base64("assets/logo_gobierno.png")
+    logo_imss_b64 = img_to_base64("assets/logo_imss.png")
+    if not (logo_gob_b64 or logo_imss_b64):
+        return ""
+    logos_html = '<div class="inst-logo-bar">'
+    if logo_gob_b64:
+        logos_html += f'<img src="data:image/png;base64,{logo_gob_b64}" alt="Gobierno de México">'
+    if logo_imss_b64:
+        logos_html += f'<img src="data:image/png;base64,{logo_imss_b64}" alt="IMSS">'
+    logos_html += '</div>'
+    return logos_html
+
+
+def html_encabezado(dia, ultima, clase="", delegacion=DELEGACION):
+    """Encabezado con la delegacion, el dia del evento y la ultima actualizacion (app y pagina estatica)."""
+    return f"""
+<div class="app-header {clase}">
+    <h1>Draft IMSS 2026</h1>
+    <p>Plazas Disponibles - {escape(delegacion)}</p>
+    <p style="font-size:0.75rem; opacity:0.7">Dia {dia} del evento | Actualizado: {ultima}</p>
+</div>
+"""
+
+
+def html_kpis(kpis):
+    return f"""
+<div class="kpi-grid">
+    <div class="kpi-card kpi-total"><div class="kpi-value">{kpis["total"]}</div><div class="kpi-label">📋 Total Plazas</div></div>
+    <div class="kpi-card kpi-disp"> <div class="kpi-value">{kpis["disp"]}</div> <div class="kpi-label">✅ Disponibles</div></div>
+    <div class="kpi-card kpi-def">  <div class="kpi-value">{kpis["def_d"]}</div><div class="kpi-label">🎓 Definitivas</div></div>
+    <div class="kpi-card kpi-int">  <div class="kpi-value">{kpis["int_d"]}</div><div class="kpi-label">📄 Interinas</div></div>
+</div>
+"""
+
+
+def html_zona(rz):
+    """Tarjeta de una zona a partir de su renglon en Agregados.por_zona."""
+    css = "disponible" if rz["disp"] > 0 else "agotada"
+    return f"""
+<div class="zona-info {css}">
+    <div class="zona-numero">{int(rz["disp"])}</div>
+    <div class="zona-sub">de {int(rz["tot"])} disponibles</div>
+    <div class="zona-sub">{int(rz["tom"])} tomadas</div>
+</div>"""
+
+
+def html_pie(delegacion=DELEGACION):
+    """Pie institucional con la delegacion de los datos (app y pagina estatica)."""
+    return f"""
+<div class="inst-footer">
+    <p><strong>Instituto Mexicano del Seguro Social</strong></p>
+    <p>Draft Médicos Especialistas 2026 · {escape(delegacion)}</p>
+</div>
+"""
+
+
+@st.cache_resource(show_spinner=False)
+def get_metricas():
+    """Retorna las metricas del proceso (tramos de tiempo y contadores)."""
+    return Metricas(habilitado=bool(st.secrets.get("metricas", True)))
+
+
+def get_backend(delegacion=None):
+    """Retorna el backend de datos de `delegacion` (la primera si no se indica), compartido por el proceso."""
+    return get_refrescador(delegacion).backend
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def resumen_eventos(delegacion, cursor, _eventos):
+    """Movimientos por dia del evento y por hora, calculados solo de la bitacora de la delegacion."""
+    ev = _eventos.assign(
+        tomadas=_eventos["delta"].astype("int64").clip(lower=0),
+        liberadas=(-_eventos["delta"].astype("int64")).clip(lower=0),
+    )
+    columnas = dict(movimientos=("delta", "size"), tomadas=("tomadas", "sum"), liberadas=("liberadas", "sum"))
+    por_dia = ev.groupby("dia").agg(**columnas)
+    por_hora = ev.groupby(ev["ts"].dt.floor("h")).agg(**columnas)
+    return por_dia, por_hora
+
+
+@st.cache_resource(show_spinner="Cargando datos...")
+def get_delegaciones():
+    """Retorna el grupo de refrescadores de fondo (uno por delegacion), uno por proceso del servidor."""
+    directorio = st.secrets.get("publicacion_dir")
+    publicador = PublicadorEstatico(directorio, get_metricas(), archivos_publicos) if directorio else None
+    fuentes = delegaciones_desde(st.secrets, DELEGACION)
+    armadas = []
+    for nombre, opciones in fuentes:
+        backend = BackendMedido(crear_backend(opciones), get_metricas())
+        # La copia solo tiene sentido si los datos sobreviven al proceso (no con el backend simulado)
+        ruta_copia = opciones.get("copia_ruta", COPIA_RUTA)
+        if ruta_copia and backend.origen and importlib.util.find_spec("pyarrow") is not None:
+            ruta_copia = Path(__file__).parent / ruta_copia
+            if len(fuentes) > 1:
+                # Una copia por delegacion: snapshot_plazas.<delegacion>.parquet
+                sufijo = normalizar(nombre).replace(" ", "_")
+                ruta_copia = ruta_copia.with_name(f"{ruta_copia.stem}.{sufijo}{ruta_copia.suffix}")
+        else:
+            ruta_copia = None
+        armadas.append((nombre, backend, ruta_copia))
+    return GrupoDelegaciones(armadas, get_metricas(), publicador,
+                             int(st.secrets.get("delegaciones_hilos", DELEGACIONES_HILOS)))
+
+
+def get_refrescador(delegacion=None):
+    """Retorna el refrescador de `delegacion`; sin indicarla, el de la primera."""
+    refrescadores = get_delegaciones().refrescadores
+    return refrescadores[delegacion] if delegacion else next(iter(refrescadores.values()))
+
+
+def nombre_fuente(vista):
+    """Nombre de la fuente de `vista` para mensajes de error, sin construir backends:
+    lo que fallo puede ser justamente construirlos (credenciales, tipo desconocido)."""
+    if vista:
+        return vista
+    return {"sqlite": BackendSQLite.nombre}.get(st.secrets.get("backend"), BackendSheets.nombre)
+
+
+def cargar_datos(vista=NACIONAL):
+    return get_delegaciones().snapshot_actual(vista)
+
+
+@st.cache_resource(show_spinner=False)
+def get_cola(delegacion=None):
+    """Retorna la cola de escrituras de una delegacion, una por proceso."""
+    return ColaEscrituras(get_backend(delegacion), get_refrescador(delegacion))
+
+
+def actualizar_dia(dia_nuevo, indice=None, delegacion=None):
+    """Actualiza el dia del evento en el backend de la delegacion."""
+    get_backend(delegacion).fijar_dia(dia_nuevo, indice)
+    get_refrescador(delegacion).solicitar(esperar=10)
+
+
+def hace(segundos):
+    """Antiguedad legible: '40 s', '12 min', '3 h 5 min', '2 d'."""
+    segundos = max(int(segundos), 0)
+    if segundos < 60:
+        return f"{segundos} s"
+    if segundos < 3600:
+        return f"{segundos // 60} min"
+    if segundos < 86400:
+        return f"{segundos // 3600} h {segundos % 3600 // 60} min"
+    return f"{segundos // 86400} d"
+
+
+def lineas_zona(dz):
+    """Lineas markdown del detalle de una zona: especialidad y plazas disponibles."""
+    return (
+        "**" + dz["especialidad"].astype(str) + "** — 🎓 `" + dz["def_disp"].astype(str)
+        + "` def. · 📄 `" + dz["int_disp"].astype(str) + "` int."
+    )
+
+
+def lineas_especialidad(datos_esp):
+    """Lineas markdown de las zonas de una especialidad: disponibles o tachadas."""
+    con_def, con_int = datos_esp["def_disp"] > 0, datos_esp["int_disp"] > 0
+    detalles = (
+        texto_donde(con_def, "🎓 `" + datos_esp["def_disp"].astype(str) + "` definitiva(s)")
+        + texto_donde(con_def & con_int, " · ")
+        + texto_donde(con_int, "📄 `" + datos_esp["int_disp"].astype(str) + "` interina(s)")
     )
-    return gspread.authorize(creds)
+    zona = datos_esp["zona"].astype(str)
+    disponible = datos_esp["total_disp"] > 0
+    return texto_donde(disponible, "**✅ " + zona + "** — " + detalles) + texto_donde(~disponible, "~~🔴 " + zona + "~~ — sin disponibles")
+
+
+def _cambio_conteo(icono, antes, despues, tipo):
+    if antes == despues:
+        return None
+    return f"{icono} `{antes}` → `{despues}` {tipo}"
+
+
+def lineas_cambios(cambios, visto_en=None):
+    """Lineas markdown del feed de ultimos cambios, del mas nuevo al mas viejo.
+
+    Los posteriores a `visto_en` (la visita anterior de la sesion) llevan 🔔.
+    """
+    lineas = []
+    for ts, zona, especialidad, def_antes, def_despues, int_antes, int_despues in reversed(cambios):
+        if def_antes is None:
+            detalle = f"nueva plaza: 🎓 `{def_despues}` def. · 📄 `{int_despues}` int."
+        elif def_despues is None:
+            detalle = "ya no aparece en la lista"
+        else:
+            partes = [p for p in (_cambio_conteo("🎓", def_antes, def_despues, "def."),
+                                  _cambio_conteo("📄", int_antes, int_despues, "int.")) if p]
+            detalle = " · ".join(partes) or "cambió el total, mismas disponibles"
+        marca = "🔔 " if visto_en is not None and ts > visto_en else ""
+        lineas.append(f"{marca}`{datetime.fromtimestamp(ts):%H:%M}` **{especialidad}** · {zona} — {detalle}")
+    return pd.Series(lineas, dtype=object)
+
+
+def mostrar_bloques(piezas, separador="\n\n", tamano_bloque=TARJETAS_POR_BLOQUE, html=False):
+    """Envia las piezas en pocos st.markdown de `tamano_bloque` piezas en vez de uno por fila.
+
+    `html` solo para piezas ya escapadas (las tarjetas); las lineas markdown llevan
+    nombres tal como vienen de la hoja y no deben interpretarse como HTML.
+    """
+    piezas = list(piezas)
+    for i in range(0, len(piezas), tamano_bloque):
+        st.markdown(separador.join(piezas[i:i + tamano_bloque]), unsafe_allow_html=html)
+
+
+def formatos_reporte():
+    """Formatos disponibles; Parquet solo si pyarrow esta instalado."""
+    return [f for f, (ext, _) in FORMATOS_REPORTE.items()
+            if ext != "parquet" or importlib.util.find_spec("pyarrow") is not None]
+
+
+def _xlsx_streaming(tabla):
+    """Escribe el Excel fila por fila (modo write_only de openpyxl), sin armar el libro en memoria."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Plazas")
+    ws.append(list(tabla.columns))
+    for fila in tabla.itertuples(index=False, name=None):
+        ws.append(fila)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=6, show_spinner=False)
+def generar_reporte(huella, ext, _df):
+    """Archivo del reporte; se genera solo al descargar y queda cacheado por contenido (Snapshot.huella) y formato.
+
+    No basta la version: una edicion a mano de Plazas no la cambia, y los datos
+    de distintas delegaciones pueden compartirla.
+    """
+    with get_metricas().tramo(f"reporte.{ext}"):
+        tabla = _df[list(COLUMNAS_REPORTE)].rename(columns=COLUMNAS_REPORTE)
+        if ext == "csv":
+            return tabla.to_csv(index=False).encode("utf-8-sig")
+        if ext == "parquet":
+            buffer = BytesIO()
+            tabla.to_parquet(buffer, index=False)
+            return buffer.getvalue()
+        return _xlsx_streaming(tabla)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def leer_importacion(contenido, nombre):
+    """Tabla de una carga masiva; se lee una vez por archivo aunque el panel se redibuje."""
+    return leer_tabla_tomas(contenido, nombre)
 
 
-@st.cache_data(ttl=60, show_spinner="Cargando datos desde Google Sheets...")
-def cargar_datos_gsheet():
-    client = get_gsheet_client()
-    sh = client.open_by_key(st.secrets["spreadsheet_id"])
+# -----------------------------------------------
+# PUBLICACION ESTATICA (vista publica sin sesiones de Streamlit)
+# -----------------------------------------------
+CSS_PUBLICO = """
+    body { margin: 0; background: #fafafa; }
+    .pagina { max-width: 760px; margin: 0 auto; padding: 1rem; }
+    .pagina h2 { font-size: 1.05rem; color: #13322B; margin: 1.4rem 0 0.6rem; }
+    .zona-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 8px; }
+    .zona-nombre { font-weight: 700; font-size: 0.85rem; margin-bottom: 4px; }
+    details { background: #fff; border: 1px solid #e0e0e0; border-radius: 8px; margin: 6px 0; padding: 8px 12px; }
+    summary { cursor: pointer; font-weight: 600; font-size: 0.9rem; }
+    details p { margin: 6px 0; font-size: 0.85rem; }
+    .descargas { font-size: 0.8rem; text-align: center; color: #777; }
+"""
+
+
+def _markdown_a_html(lineas):
+    """Convierte las lineas markdown de las pestañas (negritas, `codigo`, ~~tachado~~) a parrafos HTML."""
+    return (
+        "<p>" + lineas.map(escape)
+        .str.replace(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", regex=True)
+        .str.replace(r"`(.+?)`", r"<code>\1</code>", regex=True)
+        .str.replace(r"~~(.+?)~~", r"<del>\1</del>", regex=True)
+        + "</p>"
+    )
+
+
+def _detalle(titulo, contenido):
+    return f"<details><summary>{escape(titulo)}</summary>{contenido}</details>"
 
-    # --- Hoja 1: Plazas ---
-    ws_plazas = sh.worksheet("Plazas")
-    records = ws_plazas.get_all_records()
-    df = pd.DataFrame(records)
 
-    for col in ["def_total", "int_total", "def_tomadas", "int_tomadas"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
+def html_publico(snapshot):
+    """Pagina estatica con la presentacion de la app: KPIs, zonas, especialidades y tarjetas disponibles."""
+    df, ag, config = snapshot.df, snapshot.agregados, snapshot.config
+    dia = int(config.get("dia_evento", 1))
+    ultima = escape(str(config.get("ultima_actualizacion", "Sin actualizaciones aun")))
 
-    df["def_disp"] = df["def_total"] - df["def_tomadas"]
-    df["int_disp"] = df["int_total"] - df["int_tomadas"]
-    df["total_disp"] = df["def_disp"] + df["int_disp"]
+    delegaciones = ""
+    if snapshot.por_delegacion is not None:
+        tarjetas = "".join(
+            f'<div><div class="zona-nombre">{"✅" if r["disp"] > 0 else "🔴"} {escape(str(nombre))}</div>{html_zona(r)}</div>'
+            for nombre, r in snapshot.por_delegacion.iterrows()
+        )
+        delegaciones = f'<h2>🇲🇽 Por Delegación</h2>\n<div class="zona-grid">{tarjetas}</div>'
+
+    zonas, detalle_zonas = [], []
+    for zona, rz in ag.por_zona.iterrows():
+        icon = "✅" if rz["disp"] > 0 else "🔴"
+        zonas.append(f'<div><div class="zona-nombre">{icon} {escape(str(zona))}</div>{html_zona(rz)}</div>')
+        dz_disp = ag.disp_por_zona.get(zona)
+        contenido = ("<p>Sin plazas disponibles en esta zona.</p>" if dz_disp is None
+                     else "".join(_markdown_a_html(lineas_zona(dz_disp))))
+        n = int(rz["n_disp"])
+        detalle_zonas.append(_detalle(f"{'✅' if n > 0 else '🔴'} {zona}  —  {n} especialidades disponibles", contenido))
+
+    especialidades = []
+    for esp, r in ag.por_especialidad.iterrows():
+        disp = int(r["disp"])
+        contenido = ("<p>Sin plazas disponibles en ninguna zona.</p>" if disp == 0
+                     else "".join(_markdown_a_html(lineas_especialidad(ag.zonas_por_especialidad[esp]))))
+        especialidades.append(_detalle(
+            f"{'✅' if disp > 0 else '🔴'} {esp}  —  {disp} plaza(s) en {int(r['zonas_con'])} de {int(r['total_zonas'])} zona(s)",
+            contenido,
+        ))
+
+    logos = html_logos()
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<meta http-equiv="refresh" content="{PUBLICACION_RECARGA}">
+<title>Draft IMSS 2026 - Plazas Disponibles</title>
+<style>{compactar_css(CSS_APP + CSS_PUBLICO)}</style>
+</head>
+<body><div class="pagina">
+{logos}{html_encabezado(dia, ultima, "" if logos else "app-header-standalone", snapshot.delegacion)}
+{html_kpis(ag.kpis)}
+{delegaciones}
+<h2>🗺️ Por Zona</h2>
+<div class="zona-grid">{"".join(zonas)}</div>
+{"".join(detalle_zonas)}
+<h2>🔍 Por Especialidad</h2>
+{"".join(especialidades)}
+{_detalle("🕒 Últimos cambios", "".join(_markdown_a_html(lineas_cambios(snapshot.cambios[-CAMBIOS_VISIBLES:]))))
+ if snapshot.cambios else ""}
+<h2>📋 Plazas disponibles</h2>
+{"".join(snapshot.tarjetas[df["total_disp"].to_numpy() > 0])}
+<p class="descargas">Datos abiertos: <a href="plazas.json">JSON</a> · <a href="plazas.csv">CSV</a></p>
+{html_pie(snapshot.delegacion)}
+</div></body>
+</html>
+"""
 
-    # --- Hoja 2: Config ---
-    ws_config = sh.worksheet("Config")
-    config_data = ws_config.get_all_values()
-    config = {}
-    for row in config_data:
-        if len(row) >= 2:
-            config[row[0]] = row[1]
 
-    return df, config
+def json_publico(snapshot):
+    """Feed de disponibilidad: KPIs, resumen por zona y una fila por plaza (columnas del reporte)."""
+    df, ag, config = snapshot.df, snapshot.agregados, snapshot.config
+    datos = {
+        "delegacion": snapshot.delegacion,
+        "version": snapshot.version,
+        "dia_evento": int(config.get("dia_evento", 1)),
+        "actualizado": str(config.get("ultima_actualizacion", "")),
+        "generado_en": datetime.now().isoformat(timespec="seconds"),
+        "kpis": ag.kpis,
+        "zonas": (ag.por_zona[["disp", "tom", "tot", "n_disp"]].astype("int64")
+                  .rename_axis("zona").reset_index().to_dict("records")),
+        "plazas": df[list(COLUMNAS_REPORTE)].astype({"zona": str, "especialidad": str}).to_dict("records"),
+        "ultimos_cambios": [
+            {"hora": datetime.fromtimestamp(ts).isoformat(timespec="seconds"), "zona": zona, "especialidad": esp,
+             "def_antes": d0, "def_despues": d1, "int_antes": i0, "int_despues": i1}
+            for ts, zona, esp, d0, d1, i0, i1 in reversed(snapshot.cambios)
+        ],
+    }
+    if snapshot.por_delegacion is not None:
+        datos["delegaciones"] = snapshot.por_delegacion.reset_index().to_dict("records")
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
+def archivos_publicos(snapshot):
+    """Archivos de la vista publica para PublicadorEstatico.
 
-def actualizar_plaza_gsheet(zona, especialidad, def_tomadas, int_tomadas):
-    """Actualiza las columnas def_tomadas e int_tomadas en Google Sheets."""
-    client = get_gsheet_client()
-    sh = client.open_by_key(st.secrets["spreadsheet_id"])
-    ws = sh.worksheet("Plazas")
+    Los datos primero y la pagina al final: quien vea el HTML nuevo ya encuentra sus feeds.
+    """
+    return [
+        ("plazas.csv", generar_reporte(snapshot.huella, "csv", snapshot.df)),
+        ("plazas.json", json_publico(snapshot)),
+        ("index.html", html_publico(snapshot).encode("utf-8")),
+    ]
 
-    # Buscar la fila que coincida con zona + especialidad
-    all_data = ws.get_all_values()
-    header = all_data[0]
-    col_zona = header.index("zona")
-    col_esp = header.index("especialidad")
-    col_def_tom = header.index("def_tomadas")
-    col_int_tom = header.index("int_tomadas")
 
-    for i, row in enumerate(all_data[1:], start=2):
-        if row[col_zona] == zona and row[col_esp] == especialidad:
-            ws.update_cell(i, col_def_tom + 1, def_tomadas)
-            ws.update_cell(i, col_int_tom + 1, int_tomadas)
-            break
+# -----------------------------------------------
+# FRAGMENTOS: cada pestaña se vuelve a ejecutar sola al usar sus widgets
+# -----------------------------------------------
+def fragmento(nombre, **opciones):
+    """st.fragment que ademas mide cada ejecucion como tramo `fragmento.<nombre>`.
+
+    Un widget dentro del fragmento solo vuelve a ejecutar esa funcion, con los
+    argumentos de la ultima ejecucion completa (el mismo snapshot compartido).
+    """
+    def decorar(funcion):
+        @wraps(funcion)
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                get_metricas().observar(f"fragmento.{nombre}", time.perf_counter() - inicio)
+        return st.fragment(medida, **opciones)
+    return decorar
 
-    # Actualizar timestamp en Config
-    ws_config = sh.worksheet("Config")
-    ws_config.update_cell(2, 2, datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
 
+def recargar_si_hay_datos_nuevos(snapshot):
+    """En un rerun parcial, si el refrescador ya publico otro snapshot recarga la pagina
+    completa, para que encabezado, KPIs y pestañas muestren la misma version.
 
-def actualizar_dia_gsheet(dia_nuevo):
-    """Actualiza el dia del evento en la hoja Config."""
-    client = get_gsheet_client()
-    sh = client.open_by_key(st.secrets["spreadsheet_id"])
-    ws_config = sh.worksheet("Config")
-    ws_config.update_cell(1, 2, dia_nuevo)
+    En una ejecucion completa no hace nada: el snapshot se acaba de leer, y con
+    varias delegaciones el nacional cambia tan seguido que la pagina se
+    reiniciaria una y otra vez sin terminar de dibujarse.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or not ctx.fragment_ids_this_run:
+        return
+    if get_delegaciones().vigente(snapshot.delegacion) is not snapshot:
+        st.rerun()
 
 
 # -----------------------------------------------
 # CARGA INICIAL
 # -----------------------------------------------
+# Vueltas por seccion del script (ver draft_imss_metricas.Cronometro)
+metricas = get_metricas()
+cronometro = metricas.cronometro(_inicio_rerun)
+cronometro.vuelta("preparacion")
 
+# Vista: una delegacion o la suma nacional (selector abajo del encabezado); con una sola, su nombre
+vista = None
 try:
-    df, config = cargar_datos_gsheet()
+    grupo = get_delegaciones()
+    if grupo.varias:
+        if st.session_state.get("vista_delegacion") not in [NACIONAL, *grupo.refrescadores]:
+            st.session_state["vista_delegacion"] = NACIONAL
+        vista = st.session_state["vista_delegacion"]
+    snapshot = cargar_datos(vista)
+except ErrorTransitorio as e:
+    fuente = "Ninguna delegación está disponible" if vista == NACIONAL else f"{nombre_fuente(vista)} no está disponible"
+    st.error(f"{fuente} por ahora ({e}). Intenta de nuevo en unos segundos.")
+    st.stop()
 except Exception as e:
-    st.error("Error al conectar con Google Sheets:")
+    st.error(f"Error al conectar con {'las delegaciones' if vista == NACIONAL else nombre_fuente(vista)}:")
     st.code(traceback.format_exc())
     st.stop()
 
+df, config, indice, agregados = snapshot.df, snapshot.config, snapshot.indice, snapshot.agregados
 dia = int(config.get("dia_evento", 1))
 ultima = config.get("ultima_actualizacion", "Sin actualizaciones aun")
-zonas = sorted(df["zona"].unique())
+zonas = list(agregados.por_zona.index)
+cronometro.vuelta("carga")
 
 # -----------------------------------------------
 # HEADER
 # -----------------------------------------------
-logo_gob_b64 = img_to_base64("assets/logo_gobierno.png")
-logo_imss_b64 = img_to_base64("assets/logo_imss.png")
-
-has_logos = logo_gob_b64 or logo_imss_b64
+logos_html = html_logos()
+has_logos = bool(logos_html)
 
 if has_logos:
-    logos_html = '<div class="inst-logo-bar">'
-    if logo_gob_b64:
-        logos_html += f'<img src="data:image/png;base64,{logo_gob_b64}" alt="Gobierno de México">'
-    if logo_imss_b64:
-        logos_html += f'<img src="data:image/png;base64,{logo_imss_b64}" alt="IMSS">'
-    logos_html += '</div>'
     st.markdown(logos_html, unsafe_allow_html=True)
 
 header_extra_class = "" if has_logos else "app-header-standalone"
-st.markdown(f"""
-<div class="app-header {header_extra_class}">
-    <h1>Draft IMSS 2026</h1>
-    <p>Plazas Disponibles - OOAD Baja California</p>
-    <p style="font-size:0.75rem; opacity:0.7">Dia {dia} del evento | Actualizado: {ultima}</p>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(html_encabezado(dia, ultima, header_extra_class, snapshot.delegacion), unsafe_allow_html=True)
+
+if grupo.varias:
+    st.selectbox("Delegación", [NACIONAL, *grupo.refrescadores], key="vista_delegacion",
+                 format_func=lambda v: f"🇲🇽 {v}" if v == NACIONAL else f"🏥 {v}", label_visibility="collapsed")
+
+_refrescador = grupo.refrescadores.get(snapshot.delegacion)
+if snapshot.por_delegacion is not None:
+    _pendientes = grupo.pendientes()
+    if _pendientes:
+        st.warning("⚠️ Sin datos al día de: " + " · ".join(
+            f"{nombre} ({'último dato guardado' if con_datos else 'aún no se suma'}{f': {error}' if error else ''})"
+            for nombre, (con_datos, error) in _pendientes.items()
+        ) + ". El total nacional suma las demás.")
+elif snapshot.copia_local:
+    _estado = (f"{_refrescador.backend.nombre} no responde ({_refrescador.ultimo_error})"
+               if _refrescador.ultimo_error is not None else "actualizando en segundo plano")
+    st.warning(f"💾 Mostrando la última copia guardada, con datos de hace "
+               f"{hace(time.time() - snapshot.plazas_cargadas_en)}; {_estado}.")
+elif _refrescador.ultimo_error is not None:
+    _edad = _refrescador.edad()
+    st.warning(
+        f"⚠️ No se pudo actualizar desde {_refrescador.backend.nombre} ({_refrescador.ultimo_error}). "
+        f"Mostrando datos verificados hace {int(_edad) if _edad is not None else '?'} s."
+    )
 
 # -----------------------------------------------
 # KPIs
 # -----------------------------------------------
-total = int(df["def_total"].sum() + df["int_total"].sum())
-disp  = int(df["def_disp"].sum()  + df["int_disp"].sum())
-def_d = int(df["def_disp"].sum())
-int_d = int(df["int_disp"].sum())
+st.markdown(html_kpis(agregados.kpis), unsafe_allow_html=True)
+cronometro.vuelta("encabezado")
 
-st.markdown(f"""
-<div class="kpi-grid">
-    <div class="kpi-card kpi-total"><div class="kpi-value">{total}</div><div class="kpi-label">📋 Total Plazas</div></div>
-    <div class="kpi-card kpi-disp"> <div class="kpi-value">{disp}</div> <div class="kpi-label">✅ Disponibles</div></div>
-    <div class="kpi-card kpi-def">  <div class="kpi-value">{def_d}</div><div class="kpi-label">🎓 Definitivas</div></div>
-    <div class="kpi-card kpi-int">  <div class="kpi-value">{int_d}</div><div class="kpi-label">📄 Interinas</div></div>
-</div>
-""", unsafe_allow_html=True)
+
+# -----------------------------------------------
+# ULTIMOS CAMBIOS
+# -----------------------------------------------
+@fragmento("cambios", run_every=CAMBIOS_INTERVALO)
+def ultimos_cambios(snapshot, visto_en):
+    """Feed de ultimos cambios: se revisa solo cada CAMBIOS_INTERVALO segundos sin
+    redibujar el resto de la pagina, que se recarga solo si el usuario lo pide."""
+    vigente = get_delegaciones().vigente(snapshot.delegacion) or snapshot
+    if not vigente.cambios:
+        return
+    sin_ver = sum(c[0] > visto_en for c in vigente.cambios)
+    por_mostrar = len(set(vigente.cambios).difference(snapshot.cambios))
+    with st.expander("🕒 Últimos cambios" + (f" · 🔔 {sin_ver} nuevo(s)" if sin_ver else "")):
+        if por_mostrar and st.button(f"🔄 Ver la página con {por_mostrar} cambio(s) más", key="cambios_recargar",
+                                     use_container_width=True):
+            st.rerun()
+        mostrar_bloques(lineas_cambios(vigente.cambios[-CAMBIOS_VISIBLES:], visto_en))
+
+
+# Lo anterior a la ultima carga completa de la pagina ya se vio; en la primera, todo lo que ya estaba
+_visto_en = st.session_state.get("cambios_visto_en", time.time())
+st.session_state["cambios_visto_en"] = time.time()
+ultimos_cambios(snapshot, _visto_en)
+cronometro.vuelta("cambios")
 
 # -----------------------------------------------
 # NAVEGACION: click en zona -> filtra en Tab Plazas
@@ -326,7 +789,12 @@ tab_plazas, tab_zonas, tab_buscar, tab_normativo = st.tabs(["📋 Plazas", "🗺
 # ================================================
 # TAB 1 - PLAZAS
 # ================================================
-with tab_plazas:
+@fragmento("plazas")
+def seccion_plazas(snapshot):
+    """Pestaña Plazas: filtros, tarjetas y paginacion."""
+    recargar_si_hay_datos_nuevos(snapshot)
+    zonas = list(snapshot.agregados.por_zona.index)
+
     # Filtro desde navegacion (Tab 2) o multiselect normal
     zona_nav = st.session_state.get("zona_nav_target", None)
     if zona_nav:
@@ -334,9 +802,9 @@ with tab_plazas:
         with col_nav1:
             st.info(f"🗺️ Filtrado: **{', '.join(zona_nav)}**")
         with col_nav2:
-            if st.button("✕ Quitar filtro", use_container_width=True):
-                del st.session_state["zona_nav_target"]
-                st.rerun()
+            # Callback: corre antes del rerun del fragmento, sin st.rerun adicional
+            st.button("✕ Quitar filtro", use_container_width=True,
+                      on_click=st.session_state.pop, args=("zona_nav_target", None))
         zona_filtro = zona_nav
     else:
         zona_filtro = st.multiselect("Filtrar por Zona", options=zonas)
@@ -347,45 +815,68 @@ with tab_plazas:
     with col_b:
         tipo = st.selectbox("Tipo", ["Ambas", "Definitivas", "Interinas"], label_visibility="collapsed")
 
-    vista = df.copy()
-    if zona_filtro:
-        vista = vista[vista["zona"].isin(zona_filtro)]
-    if solo_disp:
-        vista = vista[vista["total_disp"] > 0]
-    if tipo == "Definitivas":
-        vista = vista[vista["def_disp"] > 0]
-    elif tipo == "Interinas":
-        vista = vista[vista["int_disp"] > 0]
+    with metricas.tramo("plazas.filtro"):
+        # Mapas de bits del snapshot; una combinacion ya pedida por cualquier sesion no se recalcula
+        estados = ["disp"] if solo_disp else []
+        estados += {"Definitivas": ["def"], "Interinas": ["int"]}.get(tipo, [])
+        filas_vista = snapshot.filtros.filas(zona_filtro, estados)
 
-    st.caption(f"{len(vista)} especialidades encontradas")
+    st.caption(f"{len(filas_vista)} especialidades encontradas")
 
-    if vista.empty:
+    if not len(filas_vista):
         st.info("No hay plazas disponibles con estos filtros.")
     else:
-        for _, row in vista.iterrows():
-            css = "disponible" if row["total_disp"] > 0 else "agotada"
-            badges = ""
-            if row["def_disp"] > 0:
-                badges += f'<span class="badge badge-def">🎓 {int(row["def_disp"])} Def.</span>'
-            if row["int_disp"] > 0:
-                badges += f'<span class="badge badge-int">📄 {int(row["int_disp"])} Int.</span>'
-            tom = int(row["def_tomadas"] + row["int_tomadas"])
-            if tom > 0:
-                badges += f'<span class="badge badge-tom">❌ {tom} tomadas</span>'
-            st.markdown(f"""
-            <div class="esp-card {css}">
-                <div class="esp-nombre">{row['especialidad']}</div>
-                <div class="esp-zona">{row['zona']}</div>
-                <div class="esp-badges">{badges}</div>
-            </div>""", unsafe_allow_html=True)
+        # Paginacion: se reinicia cuando cambian los filtros
+        por_pagina = int(st.secrets.get("tarjetas_por_pagina", TARJETAS_POR_PAGINA))
+        clave_filtro = (tuple(zona_filtro), solo_disp, tipo, snapshot.version)
+        if st.session_state.get("plazas_filtro") != clave_filtro:
+            st.session_state["plazas_filtro"] = clave_filtro
+            st.session_state["plazas_limite"] = por_pagina
+        limite = st.session_state["plazas_limite"]
+
+        with metricas.tramo("plazas.tarjetas"):
+            # HTML ya armado en el snapshot: cada dato nuevo solo rehace las tarjetas que cambiaron
+            mostrar_bloques(snapshot.tarjetas.iloc[filas_vista[:limite]], separador="", html=True)
+
+        restantes = len(filas_vista) - limite
+        if restantes > 0:
+            st.button(f"Cargar más ({restantes} restantes)", key="plazas_mas", use_container_width=True,
+                      on_click=st.session_state.update, args=({"plazas_limite": limite + por_pagina},))
 
         st.markdown("")
 
 
+with tab_plazas:
+    seccion_plazas(snapshot)
+cronometro.vuelta("tab_plazas")
+
+
 # ================================================
 # TAB 2 - POR ZONA
 # ================================================
-with tab_zonas:
+@fragmento("zonas")
+def seccion_zonas(snapshot):
+    """Pestaña Por Zona; el clic en una zona recarga la pagina completa para cambiar de pestaña."""
+    recargar_si_hay_datos_nuevos(snapshot)
+    agregados = snapshot.agregados
+    zonas = list(agregados.por_zona.index)
+
+    # Vista nacional: resumen por delegacion; el clic cambia a la vista de esa delegacion
+    if snapshot.por_delegacion is not None:
+        st.caption("Da clic en una delegación para ver sus zonas.")
+        delegaciones = list(snapshot.por_delegacion.index)
+        for i in range(0, len(delegaciones), 3):
+            cols = st.columns(3)
+            for j, nombre in enumerate(delegaciones[i:i + 3]):
+                rd = snapshot.por_delegacion.loc[nombre]
+                with cols[j]:
+                    st.markdown(html_zona(rd), unsafe_allow_html=True)
+                    if st.button(f"{'✅' if rd['disp'] > 0 else '🔴'} {nombre}", key=f"dbtn_{nombre}",
+                                 use_container_width=True, on_click=st.session_state.update,
+                                 args=({"vista_delegacion": nombre},)):
+                        st.rerun()
+        return
+
     st.caption("Da clic en una zona para ver sus plazas filtradas en la pestaña Plazas.")
 
     for i in range(0, len(zonas), 3):
@@ -393,19 +884,9 @@ with tab_zonas:
         for j in range(3):
             if i + j < len(zonas):
                 zona = zonas[i + j]
-                dz     = df[df["zona"] == zona]
-                disp_z = int(dz["total_disp"].sum())
-                tom_z  = int((dz["def_tomadas"] + dz["int_tomadas"]).sum())
-                tot_z  = int((dz["def_total"] + dz["int_total"]).sum())
-                css    = "disponible" if disp_z > 0 else "agotada"
-                icon   = "✅" if disp_z > 0 else "🔴"
+                icon = "✅" if agregados.por_zona.at[zona, "disp"] > 0 else "🔴"
                 with cols[j]:
-                    st.markdown(f"""
-                    <div class="zona-info {css}">
-                        <div class="zona-numero">{disp_z}</div>
-                        <div class="zona-sub">de {tot_z} disponibles</div>
-                        <div class="zona-sub">{tom_z} tomadas</div>
-                    </div>""", unsafe_allow_html=True)
+                    st.markdown(html_zona(agregados.por_zona.loc[zona]), unsafe_allow_html=True)
                     if st.button(f"{icon} {zona}", key=f"zbtn_{zona}", use_container_width=True):
                         st.session_state["zona_ms"] = [zona]
                         st.session_state["ir_a_plazas"] = True
@@ -414,21 +895,29 @@ with tab_zonas:
     st.markdown("---")
     st.markdown("#### Detalle por zona")
     for zona in zonas:
-        dz = df[df["zona"] == zona]
-        dz_disp = dz[dz["total_disp"] > 0]
-        n = len(dz_disp)
+        n = int(agregados.por_zona.at[zona, "n_disp"])
         with st.expander(f"{'✅' if n > 0 else '🔴'} {zona}  —  {n} especialidades disponibles"):
-            if dz_disp.empty:
+            dz_disp = agregados.disp_por_zona.get(zona)
+            if dz_disp is None:
                 st.warning("Sin plazas disponibles en esta zona.")
             else:
-                for _, r in dz_disp.iterrows():
-                    st.markdown(f"**{r['especialidad']}** — 🎓 `{int(r['def_disp'])}` def. · 📄 `{int(r['int_disp'])}` int.")
+                mostrar_bloques(lineas_zona(dz_disp))
 
 
+with tab_zonas:
+    seccion_zonas(snapshot)
+
+cronometro.vuelta("tab_zonas")
+
 # ================================================
 # TAB 3 - BUSCAR POR ESPECIALIDAD
 # ================================================
-with tab_buscar:
+@fragmento("buscar")
+def seccion_buscar(snapshot):
+    """Pestaña Buscar Especialidad: escribir en el buscador solo redibuja esta lista."""
+    recargar_si_hay_datos_nuevos(snapshot)
+    agregados = snapshot.agregados
+
     st.markdown("#### 🔍 Buscar por Especialidad")
     st.caption("Escribe el nombre de la especialidad para filtrar. Da clic para ver en qué zonas hay plazas.")
 
@@ -436,15 +925,8 @@ with tab_buscar:
     filtro_esp = st.text_input("🔎 Escribe para buscar...", key="filtro_esp",
                                placeholder="Ej: Pediatría, Cirugía, Medicina...")
 
-    # Agrupar datos por especialidad
-    todas_especialidades = sorted(df["especialidad"].unique())
-
-    # Filtrar por texto ingresado
-    if filtro_esp:
-        especialidades_filtradas = [e for e in todas_especialidades
-                                    if filtro_esp.strip().lower() in e.lower()]
-    else:
-        especialidades_filtradas = todas_especialidades
+    # Indice del snapshot: sin acentos, tolerante a errores y ordenado por relevancia
+    especialidades_filtradas = snapshot.busqueda.buscar(filtro_esp)
 
     st.caption(f"{len(especialidades_filtradas)} especialidades encontradas")
 
@@ -452,58 +934,185 @@ with tab_buscar:
         st.warning(f"No se encontró ninguna especialidad con \"{filtro_esp}\".")
     else:
         for esp in especialidades_filtradas:
-            datos_esp = df[df["especialidad"] == esp]
-            total_disp_esp = int(datos_esp["total_disp"].sum())
-            zonas_con = len(datos_esp[datos_esp["total_disp"] > 0])
-            total_zonas = len(datos_esp)
+            resumen_esp = agregados.por_especialidad.loc[esp]
+            total_disp_esp = int(resumen_esp["disp"])
+            zonas_con = int(resumen_esp["zonas_con"])
+            total_zonas = int(resumen_esp["total_zonas"])
             icon = "✅" if total_disp_esp > 0 else "🔴"
 
             with st.expander(f"{icon} {esp}  —  {total_disp_esp} plaza(s) en {zonas_con} de {total_zonas} zona(s)"):
                 if total_disp_esp == 0:
                     st.error("Sin plazas disponibles en ninguna zona.")
                 else:
-                    # Ordenar zonas: primero las que tienen disponibles
-                    datos_esp = datos_esp.sort_values("total_disp", ascending=False)
-                    for _, row in datos_esp.iterrows():
-                        d = int(row["total_disp"])
-                        if d > 0:
-                            detalles = []
-                            if row["def_disp"] > 0:
-                                detalles.append(f"🎓 `{int(row['def_disp'])}` definitiva(s)")
-                            if row["int_disp"] > 0:
-                                detalles.append(f"📄 `{int(row['int_disp'])}` interina(s)")
-                            st.markdown(f"**✅ {row['zona']}** — {' · '.join(detalles)}")
-                        else:
-                            st.markdown(f"~~🔴 {row['zona']}~~ — sin disponibles")
+                    # Zonas ya ordenadas: primero las que tienen disponibles
+                    mostrar_bloques(lineas_especialidad(agregados.zonas_por_especialidad[esp]))
+
 
+with tab_buscar:
+    seccion_buscar(snapshot)
+
+cronometro.vuelta("tab_buscar")
 
 # ================================================
 # TAB 4 - NORMATIVO (protegido con contrasena)
 # ================================================
-with tab_normativo:
+@fragmento("normativo.formulario")
+def formulario_toma(snapshot):
+    """Formulario de plazas tomadas: cambiar zona, especialidad o conteos solo redibuja el formulario."""
+    recargar_si_hay_datos_nuevos(snapshot)
+    df, agregados = snapshot.df, snapshot.agregados
+    zonas = list(agregados.por_zona.index)
+    dia = int(snapshot.config.get("dia_evento", 1))
+
+    zona_sel = st.selectbox("🗺️ Zona / OOAD", zonas, key="n_zona")
+    espec_ops = agregados.especialidades_por_zona[zona_sel]
+    espec_sel = st.selectbox("🔬 Especialidad", espec_ops, key="n_espec")
+
+    fila = df.iloc[agregados.posicion[(zona_sel, espec_sel)]]
+    # Incluye guardados en cola o recien confirmados que el snapshot aun no refleja
+    cola = get_cola(snapshot.delegacion)
+    def_vigente, int_vigente = cola.valores(zona_sel, espec_sel, snapshot, fila)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Definitivas", int(fila["def_total"]))
+        n_def = st.number_input("Tomadas (Def.)", 0, int(fila["def_total"]),
+                                def_vigente, key="n_def")
+    with col2:
+        st.metric("Total Interinas", int(fila["int_total"]))
+        n_int = st.number_input("Tomadas (Int.)", 0, int(fila["int_total"]),
+                                int_vigente, key="n_int")
+
+    disp_prev_def = int(fila["def_total"]) - n_def
+    disp_prev_int = int(fila["int_total"]) - n_int
+    st.markdown(f"> **Vista previa:** quedaran **{disp_prev_def}** definitivas y **{disp_prev_int}** interinas disponibles.")
+
+    if st.button("💾 Guardar cambios", use_container_width=True, type="primary"):
+        ticket = cola.encolar(Toma(zona_sel, espec_sel, n_def, n_int, def_vigente, int_vigente,
+                                   dia=dia, operador=st.session_state.get("operador", "normativo")))
+        st.session_state.setdefault("tickets", []).append(ticket)
+
+
+@st.fragment(run_every=1)
+def estado_guardados():
+    """Resultado de los guardados de esta sesion; al confirmarse uno, recarga la pagina."""
+    ahora = time.time()
+    tickets = [t for t in st.session_state.get("tickets", [])
+               if t.resuelto_en is None or ahora - t.resuelto_en < TICKET_VISIBLE]
+    st.session_state["tickets"] = tickets
+    detalle = tickets
+    if len(tickets) > TICKETS_DETALLE:
+        estados = Counter(t.estado for t in tickets)
+        st.info(f"⏳ {estados['pendiente']} pendiente(s) · ✅ {estados['guardado']} guardado(s) · "
+                f"⚠️ {estados['rechazado'] + estados['error']} sin guardar")
+        detalle = [t for t in tickets if t.estado in ("rechazado", "error")]
+    for t in detalle:
+        nombre = f"{t.toma.zona} · {t.toma.especialidad}"
+        if t.estado == "pendiente":
+            st.info(f"⏳ Guardando: {nombre}" + (f" (reintentando: {t.mensaje})" if t.mensaje else ""))
+        elif t.estado == "guardado":
+            st.success(f"✅ Guardado: {nombre}")
+        elif t.estado == "rechazado":
+            st.warning(f"⚠️ No se guardó: {t.mensaje}. Revisa los valores y vuelve a guardar.")
+        else:
+            st.error(f"Error al guardar {nombre}: {t.mensaje}")
+    # Cuando el snapshot ya incluye un guardado confirmado, refresca KPIs y listas
+    if any(t.estado == "guardado" and not t.mostrado
+           and get_refrescador(t.delegacion).snapshot.plazas_cargadas_en > t.resuelto_en for t in tickets):
+        for t in tickets:
+            if t.estado == "guardado":
+                t.mostrado = True
+        st.rerun()
+
+
+@fragmento("normativo.carga_masiva")
+def carga_masiva(snapshot):
+    """Carga masiva: archivo o tabla pegada, validada contra el snapshot y aplicada en un solo lote."""
+    df = snapshot.df
+    dia = int(snapshot.config.get("dia_evento", 1))
+    with st.expander("📤 Carga masiva (CSV / Excel)"):
+        st.caption("Mismo formato que el reporte descargado: se usan Zona, Especialidad, Def.Tomadas e "
+                   "Int.Tomadas. Una celda de tomadas vacía conserva el valor actual.")
+        archivo = st.file_uploader("Archivo", type=["csv", "xlsx"], key="n_archivo")
+        pegado = st.text_area("…o pega la tabla con encabezados", key="n_pegado", height=120)
+        if archivo is not None or pegado.strip():
+            try:
+                tabla = leer_importacion(archivo.getvalue(), archivo.name) if archivo else leer_importacion(pegado, "")
+            except ValueError as e:
+                st.error(f"No se pudo leer la tabla: {e}")
+            else:
+                revision = validar_tomas(tabla, df)
+                conteo = revision["estado"].value_counts()
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Cambios", int(conteo.get("cambio", 0)))
+                col2.metric("Sin cambio", int(conteo.get("sin cambio", 0)))
+                col3.metric("Con error", int(conteo.get("error", 0)))
+                revisar = revision[revision["estado"] != "sin cambio"]
+                if not revisar.empty:
+                    st.dataframe(revisar.rename(columns={
+                        "renglon": "Renglón", "zona": "Zona", "especialidad": "Especialidad",
+                        "def_antes": "Def. antes", "def_nuevo": "Def. nueva",
+                        "int_antes": "Int. antes", "int_nuevo": "Int. nueva",
+                        "estado": "Estado", "motivo": "Motivo",
+                    }), hide_index=True, use_container_width=True)
+                cambios = revision[revision["estado"] == "cambio"]
+                if conteo.get("error", 0):
+                    st.caption("Las filas con error no se aplican; corrígelas y vuelve a cargar la tabla.")
+                if st.button(f"💾 Aplicar {len(cambios)} cambio(s)", disabled=cambios.empty,
+                             use_container_width=True, type="primary", key="n_aplicar_lote"):
+                    operador = st.session_state.get("operador", "normativo")
+                    tomas = [
+                        Toma(z, e, int(d_nuevo), int(i_nuevo), int(d_antes), int(i_antes), dia=dia, operador=operador)
+                        for z, e, d_antes, d_nuevo, i_antes, i_nuevo in cambios[
+                            ["zona", "especialidad", "def_antes", "def_nuevo", "int_antes", "int_nuevo"]
+                        ].itertuples(index=False, name=None)
+                    ]
+                    st.session_state.setdefault("tickets", []).extend(get_cola(snapshot.delegacion).encolar_lote(tomas))
+
+
+@fragmento("normativo")
+def seccion_normativo(snapshot):
+    """Pestaña Normativo: acceso, dia del evento, formularios, reporte y diagnostico."""
+    recargar_si_hay_datos_nuevos(snapshot)
+    df, indice = snapshot.df, snapshot.indice
+    dia = int(snapshot.config.get("dia_evento", 1))
+
     st.markdown("#### 🔐 Panel Normativo")
     st.info("Solo el equipo normativo debe operar esta seccion.")
 
+    # Los guardados van a la hoja de una delegacion: en la vista nacional no hay a donde escribir
+    if snapshot.por_delegacion is not None:
+        st.caption("Elige una delegación en el selector de arriba para operar su panel.")
+        return
+
     # --- Autenticacion simple ---
     if "normativo_auth" not in st.session_state:
         st.session_state.normativo_auth = False
 
     if not st.session_state.normativo_auth:
+        operador = st.text_input("Tu nombre (queda en el historial de movimientos)", key="operador_input")
         pwd = st.text_input("Contrasena de acceso", type="password", key="pwd_input")
         if st.button("Ingresar", use_container_width=True):
             if pwd == st.secrets.get("normativo_password", "draft2026"):
                 st.session_state.normativo_auth = True
+                st.session_state.operador = operador.strip() or "normativo"
                 st.rerun()
             else:
                 st.error("Contrasena incorrecta.")
     else:
+        # --- Renglones de Plazas que no se pudieron leer tal cual (ver parsear_plazas) ---
+        problemas = (indice or {}).get("problemas")
+        if problemas:
+            with st.expander(f"⚠️ {len(problemas)} renglón(es) de la hoja Plazas con problemas"):
+                st.dataframe(pd.DataFrame(problemas, columns=["Fila", "Problema"]),
+                             hide_index=True, use_container_width=True)
+
         # --- Dia del evento ---
         dia_nuevo = st.number_input("📅 Dia del evento", min_value=1, max_value=10, value=dia, step=1)
         if dia_nuevo != dia:
             if st.button("Actualizar dia del evento", use_container_width=True):
                 try:
-                    actualizar_dia_gsheet(dia_nuevo)
-                    st.cache_data.clear()
+                    actualizar_dia(dia_nuevo, indice, snapshot.delegacion)
                     st.success(f"Dia actualizado a {dia_nuevo}")
                     st.rerun()
                 except Exception as e:
@@ -511,85 +1120,103 @@ with tab_normativo:
 
         st.markdown("---")
 
-        # --- Formulario de plazas tomadas ---
-        zona_sel = st.selectbox("🗺️ Zona / OOAD", zonas, key="n_zona")
-        espec_ops = sorted(df[df["zona"] == zona_sel]["especialidad"].unique())
-        espec_sel = st.selectbox("🔬 Especialidad", espec_ops, key="n_espec")
+        formulario_toma(snapshot)
+        estado_guardados()
 
-        fila = df[(df["zona"] == zona_sel) & (df["especialidad"] == espec_sel)].iloc[0]
-
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Total Definitivas", int(fila["def_total"]))
-            n_def = st.number_input("Tomadas (Def.)", 0, int(fila["def_total"]),
-                                    int(fila["def_tomadas"]), key="n_def")
-        with col2:
-            st.metric("Total Interinas", int(fila["int_total"]))
-            n_int = st.number_input("Tomadas (Int.)", 0, int(fila["int_total"]),
-                                    int(fila["int_tomadas"]), key="n_int")
-
-        disp_prev_def = int(fila["def_total"]) - n_def
-        disp_prev_int = int(fila["int_total"]) - n_int
-        st.markdown(f"> **Vista previa:** quedaran **{disp_prev_def}** definitivas y **{disp_prev_int}** interinas disponibles.")
-
-        if st.button("💾 Guardar cambios", use_container_width=True, type="primary"):
-            try:
-                actualizar_plaza_gsheet(zona_sel, espec_sel, n_def, n_int)
-                st.cache_data.clear()
-                st.success(f"✅ Guardado: {zona_sel} · {espec_sel}")
-                st.rerun()
-            except Exception as e:
-                st.error(f"Error al guardar: {e}")
+        carga_masiva(snapshot)
 
         st.markdown("---")
 
-        # --- Descargar Excel ---
-        st.markdown("#### 📥 Descargar reporte Excel")
-        tabla_excel = df[["zona", "especialidad", "def_total", "int_total",
-                          "def_tomadas", "int_tomadas", "def_disp", "int_disp", "total_disp"]].copy()
-        tabla_excel.columns = ["Zona", "Especialidad", "Def.Total", "Int.Total",
-                               "Def.Tomadas", "Int.Tomadas", "Def.Disponibles", "Int.Disponibles", "Total Disp."]
-        buffer = BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            tabla_excel.to_excel(writer, index=False, sheet_name="Plazas")
+        # --- Descargar reporte (se genera al hacer clic, no en cada rerun) ---
+        st.markdown("#### 📥 Descargar reporte")
+        formato = st.selectbox("Formato", formatos_reporte(), key="n_formato")
+        ext, mime = FORMATOS_REPORTE[formato]
         st.download_button(
-            "📥 Descargar Excel",
-            data=buffer.getvalue(),
-            file_name=f"plazas_dia{dia}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            "📥 Descargar reporte",
+            data=partial(generar_reporte, snapshot.huella, ext, df),
+            file_name=f"plazas_dia{dia}_{datetime.now().strftime('%Y%m%d_%H%M')}.{ext}",
+            mime=mime,
+            on_click="ignore",
             use_container_width=True,
         )
 
+        # --- Historial de movimientos (bitacora de eventos) ---
+        with st.expander("📜 Historial de movimientos"):
+            eventos = snapshot.eventos
+            if eventos.empty:
+                st.caption("Sin movimientos registrados.")
+            else:
+                por_dia, por_hora = resumen_eventos(snapshot.delegacion, snapshot.cursor_eventos, eventos)
+                st.dataframe(por_dia.rename_axis("Día").rename(columns=str.capitalize), use_container_width=True)
+                st.bar_chart(por_hora[["tomadas", "liberadas"]])
+                st.caption("Últimos movimientos")
+                st.dataframe(eventos.tail(20).iloc[::-1], hide_index=True, use_container_width=True)
+
         st.markdown("---")
+        reruns = metricas.histogramas.get("rerun")
+        if "arranque_en_frio_s" in metricas.valores and reruns:
+            st.caption(
+                f"⏱️ Arranque en frío: {metricas.valores['arranque_en_frio_s'] * 1000:.0f} ms · "
+                f"rerun p50 {reruns.percentil(50) * 1000:.0f} ms / p95 {reruns.percentil(95) * 1000:.0f} ms "
+                f"({reruns.cuenta} reruns)"
+            )
+
+        # Panel de diagnostico, oculto salvo con ?diag=1 en la URL
+        if st.query_params.get("diag") == "1":
+            with st.expander("🩺 Diagnóstico", expanded=True):
+                metricas_backend = get_backend(snapshot.delegacion).metricas()
+                resumen = metricas.resumen(metricas_backend)
+                st.dataframe(pd.DataFrame.from_dict(resumen["histogramas"], orient="index"),
+                             use_container_width=True)
+                if resumen["contadores"]:
+                    st.caption(" · ".join(f"{k}: {v}" for k, v in resumen["contadores"].items()))
+                if metricas_backend:
+                    st.caption("📡 " + " · ".join(f"{k}: {round(v, 1) if isinstance(v, float) else v}"
+                                                   for k, v in sorted(metricas_backend.items())))
+                col_p, col_j = st.columns(2)
+                with col_p:
+                    st.download_button("Prometheus", data=partial(metricas.prometheus, metricas_backend),
+                                       file_name="draft_imss_metricas.prom", mime="text/plain",
+                                       on_click="ignore", use_container_width=True)
+                with col_j:
+                    st.download_button("JSON", data=partial(metricas.json, metricas_backend),
+                                       file_name="draft_imss_metricas.json", mime="application/json",
+                                       on_click="ignore", use_container_width=True)
+
         if st.button("🔒 Cerrar sesion normativo", use_container_width=True):
             st.session_state.normativo_auth = False
             st.rerun()
 
 
+with tab_normativo:
+    seccion_normativo(snapshot)
+
+cronometro.vuelta("tab_normativo")
+
 # -----------------------------------------------
 # FOOTER
 # -----------------------------------------------
-st.markdown("""
-<div class="inst-footer">
-    <p><strong>Instituto Mexicano del Seguro Social</strong></p>
-    <p>Draft Médicos Especialistas 2026 · Delegación Baja California y San Luis Rio Colorado Sonora</p>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(html_pie(snapshot.delegacion), unsafe_allow_html=True)
 
 # -----------------------------------------------
 # SWIPE ENTRE TABS (movil)
 # -----------------------------------------------
 import streamlit.components.v1 as components
+# Si el iframe se vuelve a montar, primero quita los listeners anteriores para no duplicarlos
 components.html("""
 <script>
 (function() {
     const doc = window.parent.document;
+    if (doc.__draftSwipe) {
+        doc.removeEventListener('touchstart', doc.__draftSwipe.inicio);
+        doc.removeEventListener('touchend', doc.__draftSwipe.fin);
+    }
     let startX = 0, startY = 0;
-    doc.addEventListener('touchstart', function(e) {
+    function inicio(e) {
         startX = e.changedTouches[0].screenX;
         startY = e.changedTouches[0].screenY;
-    });
-    doc.addEventListener('touchend', function(e) {
+    }
+    function fin(e) {
         const diffX = startX - e.changedTouches[0].screenX;
         const diffY = startY - e.changedTouches[0].screenY;
         if (Math.abs(diffX) < 60 || Math.abs(diffY) > Math.abs(diffX)) return;
@@ -599,7 +1226,10 @@ components.html("""
         tabs.forEach(function(t, i) { if (t.getAttribute('aria-selected') === 'true') active = i; });
         if (diffX > 0 && active < tabs.length - 1) tabs[active + 1].click();
         else if (diffX < 0 && active > 0) tabs[active - 1].click();
-    });
+    }
+    doc.addEventListener('touchstart', inicio);
+    doc.addEventListener('touchend', fin);
+    doc.__draftSwipe = {inicio: inicio, fin: fin};
 })();
 </script>
 """, height=0)
@@ -616,3 +1246,12 @@ if _ir_a_plazas:
     })();
     </script>
     """, height=0)
+
+# -----------------------------------------------
+# TIEMPOS: el primer rerun del proceso es el arranque en frio; los demas van al histograma
+# -----------------------------------------------
+cronometro.vuelta("pie")
+if "arranque_en_frio_s" in metricas.valores:
+    cronometro.total()
+else:
+    metricas.fijar("arranque_en_frio_s", round(time.perf_counter() - _inicio_rerun, 4))
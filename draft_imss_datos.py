@@ -0,0 +1,1316 @@
+"""
+DRAFT IMSS 2026 - Acceso a datos
+Backends intercambiables para el monitor de plazas
+
+Todos exponen la misma interfaz (ver BackendDatos) y se eligen con
+st.secrets["backend"]:
+    "sheets"  Google Sheets (por defecto)
+    "sqlite"  base local (st.secrets["sqlite_ruta"], semilla opcional en CSV)
+    "fake"    Sheets simulado en memoria, para pruebas de carga y uso sin red
+"""
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import random
+import tempfile
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+# Conexiones HTTP reutilizables por el cliente compartido de Sheets
+HTTP_POOL_SIZE = 16
+
+COLUMNAS_CONTEO = ["def_total", "int_total", "def_tomadas", "int_tomadas"]
+
+# Bitacora de movimientos: una fila por cambio de plazas tomadas (hoja/tabla "Eventos").
+# `delta` es el cambio (+ toma, - liberacion) y `valor` el total resultante, asi que
+# reaplicar un evento es idempotente.
+COLUMNAS_EVENTO = ["ts", "dia", "zona", "especialidad", "tipo", "delta", "valor", "operador"]
+# En Sheets cada fila lleva ademas el id de su Toma (columna I), para no anotarla dos veces en un reintento
+COLUMNAS_EVENTO_HOJA = COLUMNAS_EVENTO + ["toma"]
+
+# Tipos compactos del snapshot: los conteos caben en int16 y zona/especialidad se repiten en muchas filas
+TIPO_CONTEO = "int16"
+COLUMNAS_CATEGORIA = ["zona", "especialidad"]
+
+# Codigos HTTP de Sheets que vale la pena reintentar: cuota excedida y errores del servidor
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+
+def completar_columnas(df):
+    """Convierte los conteos a enteros compactos y zona/especialidad a categorias; agrega las columnas de disponibles."""
+    for col in COLUMNAS_CONTEO:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).clip(-32768, 32767).astype(TIPO_CONTEO)
+    for col in COLUMNAS_CATEGORIA:
+        df[col] = df[col].astype("category")
+    return agregar_disponibles(df)
+
+
+def agregar_disponibles(df):
+    """Columnas de plazas disponibles por tipo y en total."""
+    df["def_disp"] = df["def_total"] - df["def_tomadas"]
+    df["int_disp"] = df["int_total"] - df["int_tomadas"]
+    df["total_disp"] = df["def_disp"] + df["int_disp"]
+    return df
+
+
+def version_datos(config):
+    """Marcador de version de Plazas: la revision que escribe cada guardado o, si no existe, el timestamp."""
+    return config.get("revision") or config.get("ultima_actualizacion", "")
+
+
+def _entero(valor):
+    """Celda de conteo a entero, con el mismo criterio que la carga (vacio o texto = 0)."""
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass(frozen=True)
+class Toma:
+    """Nuevo valor de plazas tomadas para una especialidad.
+
+    `esperado_def`/`esperado_int` son los valores que vio el operador al editar;
+    si el dato guardado ya no coincide, el cambio se rechaza por conflicto.
+    `dia` y `operador` solo se registran en la bitacora de eventos. `id` es
+    unico por guardado y se conserva en los reintentos de la cola.
+    """
+    zona: str
+    especialidad: str
+    def_tomadas: int
+    int_tomadas: int
+    esperado_def: Optional[int] = None
+    esperado_int: Optional[int] = None
+    dia: int = 0
+    operador: str = ""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex, compare=False)
+
+    @property
+    def clave(self):
+        return (self.zona, self.especialidad)
+
+    def conflicto(self, def_actual, int_actual):
+        """Mensaje de conflicto si los valores actuales no son los esperados, o None.
+
+        Si el dato ya tiene el valor nuevo (p. ej. un reintento tras un guardado que
+        si llego), no hay conflicto.
+        """
+        if self.esperado_def is None or (def_actual, int_actual) in (
+                (self.esperado_def, self.esperado_int), (self.def_tomadas, self.int_tomadas)):
+            return None
+        return (f"{self.zona} · {self.especialidad} cambió mientras editabas "
+                f"(ahora {def_actual} def. / {int_actual} int. tomadas)")
+
+    def eventos(self, def_antes, int_antes, ts):
+        """Filas de bitacora (COLUMNAS_EVENTO) de los tipos de plaza que cambian."""
+        filas = []
+        for tipo, antes, despues in (("def", def_antes, self.def_tomadas), ("int", int_antes, self.int_tomadas)):
+            if int(despues) != int(antes):
+                filas.append([ts, int(self.dia), self.zona, self.especialidad, tipo,
+                              int(despues) - int(antes), int(despues), self.operador])
+        return filas
+
+
+def _marca_guardado():
+    """Timestamp visible y revision unica que acompanan a cada guardado."""
+    return datetime.now().strftime("%d/%m/%Y %H:%M:%S"), f"r{time.time_ns():x}"
+
+
+def _marca_evento():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def eventos_a_df(filas):
+    """DataFrame tipado de filas de bitacora (las celdas de Sheets llegan como texto)."""
+    filas = [list(f) + [""] * (len(COLUMNAS_EVENTO) - len(f)) for f in filas]
+    df = pd.DataFrame(filas, columns=COLUMNAS_EVENTO)
+    df["ts"] = pd.to_datetime(df["ts"], errors="coerce")
+    for col in ["dia", "delta", "valor"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(TIPO_CONTEO)
+    for col in ["zona", "especialidad", "tipo", "operador"]:
+        df[col] = df[col].astype(str).astype("category")
+    return df
+
+
+class BackendDatos:
+    """Interfaz comun de almacenamiento.
+
+    `indice` es informacion propia de cada backend (p. ej. filas de la hoja)
+    que viaja dentro del snapshot y se devuelve al guardar para evitar busquedas.
+    """
+
+    nombre = "datos"
+    # Fuente persistente de los datos (id del libro, ruta de la base); None si no sobrevive al proceso
+    origen = None
+
+    def leer_config(self):
+        """Lectura barata de Config: retorna (config, indice_config)."""
+        raise NotImplementedError
+
+    def cargar_plazas(self):
+        """Lectura completa de Plazas: retorna (df, indice_plazas)."""
+        raise NotImplementedError
+
+    def cargar_completo(self):
+        """Plazas y Config juntas: retorna (config, indice_config, df, indice_plazas)."""
+        return (*self.leer_config(), *self.cargar_plazas())
+
+    def aplicar_tomas(self, tomas, indice=None):
+        """Aplica un lote de Toma con un solo registro de guardado en Config.
+
+        Cada cambio aceptado se agrega a la bitacora de eventos. Retorna
+        {(zona, especialidad): motivo} con las tomas rechazadas (conflicto o
+        plaza inexistente); las demas quedan guardadas.
+        """
+        raise NotImplementedError
+
+    def leer_eventos(self, desde=0):
+        """Eventos posteriores al cursor `desde`: retorna (filas COLUMNAS_EVENTO, nuevo_cursor).
+
+        El cursor es opaco (fila en Sheets, id en SQLite); 0 lee la bitacora completa.
+        """
+        return [], desde
+
+    def aplicar_toma(self, zona, especialidad, def_tomadas, int_tomadas, indice=None):
+        """Fija las plazas tomadas de una especialidad, sin verificar valores previos."""
+        rechazos = self.aplicar_tomas([Toma(zona, especialidad, def_tomadas, int_tomadas)], indice)
+        if rechazos:
+            raise KeyError(next(iter(rechazos.values())))
+
+    def fijar_dia(self, dia, indice=None):
+        """Actualiza el dia del evento."""
+        raise NotImplementedError
+
+    def metricas(self):
+        """Contadores de acceso al almacenamiento (vacio si el backend no los lleva)."""
+        return {}
+
+
+# -----------------------------------------------
+# IMPORTACION MASIVA (CSV / Excel / tabla pegada)
+# -----------------------------------------------
+# Columnas que se toman de una importacion, con su nombre en el reporte exportado.
+# Los encabezados se comparan sin mayusculas ni puntuacion: "Def.Tomadas" o "def_tomadas".
+COLUMNAS_IMPORTACION = {
+    "zona": "Zona", "especialidad": "Especialidad", "def_tomadas": "Def.Tomadas", "int_tomadas": "Int.Tomadas",
+}
+
+
+def _nombre_columna(nombre):
+    return re.sub(r"[^0-9a-z]", "", str(nombre).casefold())
+
+
+def leer_tabla_tomas(contenido, nombre=""):
+    """Tabla de tomas desde un archivo (bytes de .xlsx o .csv) o texto pegado.
+
+    Acepta el mismo formato que el reporte descargado; las columnas que no son
+    de COLUMNAS_IMPORTACION se ignoran. Todo se lee como texto: convertir y
+    validar le toca a validar_tomas. Lanza ValueError si no se puede leer.
+    """
+    if isinstance(contenido, bytes) and not nombre.lower().endswith(".xlsx"):
+        try:
+            contenido = contenido.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            contenido = contenido.decode("latin-1")
+    if not contenido.strip():
+        raise ValueError("la tabla esta vacia")
+    try:
+        if isinstance(contenido, bytes):
+            tabla = pd.read_excel(BytesIO(contenido), dtype=str)
+        else:
+            # sep=None detecta coma, punto y coma o tabulador (lo que deja pegar desde Excel)
+            tabla = pd.read_csv(StringIO(contenido.strip()), sep=None, engine="python", dtype=str,
+                                skip_blank_lines=False)
+    except (pd.errors.ParserError, csv.Error) as e:
+        raise ValueError(f"formato no reconocido ({e})") from e
+    except Exception as e:
+        # openpyxl y read_excel lanzan sus propios errores con archivos dañados
+        raise ValueError(f"no se pudo abrir el archivo ({e})") from e
+
+    columnas = {}
+    for col in tabla.columns:
+        interna = next((c for c in COLUMNAS_IMPORTACION if _nombre_columna(c) == _nombre_columna(col)), None)
+        if interna and interna not in columnas.values():
+            columnas[col] = interna
+    faltan = [nombre for c, nombre in COLUMNAS_IMPORTACION.items() if c not in columnas.values()]
+    if faltan:
+        raise ValueError("faltan columnas: " + ", ".join(faltan))
+    return tabla[list(columnas)].rename(columns=columnas)[list(COLUMNAS_IMPORTACION)].dropna(how="all")
+
+
+def validar_tomas(tabla, df):
+    """Compara una tabla de leer_tabla_tomas con las plazas del snapshot, por columnas.
+
+    Retorna un renglon por fila importada (`renglon` es su numero en el archivo)
+    con los valores actuales y nuevos, `estado` ("cambio", "sin cambio" o
+    "error") y el `motivo` del error. Una celda de tomadas vacia conserva el
+    valor actual.
+    """
+    importada = pd.DataFrame({
+        # El indice conserva la posicion en el archivo aunque se hayan quitado filas vacias
+        "renglon": tabla.index + 2,
+        "zona": tabla["zona"].fillna("").astype(str).str.strip().to_numpy(),
+        "especialidad": tabla["especialidad"].fillna("").astype(str).str.strip().to_numpy(),
+        "def_texto": tabla["def_tomadas"].fillna("").astype(str).str.strip().to_numpy(),
+        "int_texto": tabla["int_tomadas"].fillna("").astype(str).str.strip().to_numpy(),
+    })
+    actual = pd.DataFrame({
+        "zona": df["zona"].astype(str), "especialidad": df["especialidad"].astype(str),
+        "def_total": df["def_total"].astype("int64"), "int_total": df["int_total"].astype("int64"),
+        "def_antes": df["def_tomadas"].astype("int64"), "int_antes": df["int_tomadas"].astype("int64"),
+    })
+    m = importada.merge(actual, on=["zona", "especialidad"], how="left", indicator=True)
+    existe = m["_merge"] == "both"
+
+    # Cada regla aporta un motivo; una fila se queda con el primero que no cumple
+    reglas = [
+        ((m["zona"] == "") | (m["especialidad"] == ""), pd.Series("Falta zona o especialidad", index=m.index)),
+        (~existe, "No existe la plaza " + m["zona"] + " / " + m["especialidad"]),
+        (m.duplicated(["zona", "especialidad"], keep=False), pd.Series("Plaza repetida en la tabla", index=m.index)),
+    ]
+    for tipo, etiqueta in (("def", "Def."), ("int", "Int.")):
+        texto = m[f"{tipo}_texto"]
+        numero = pd.to_numeric(texto, errors="coerce")
+        invalido = (texto != "") & (numero.isna() | (numero % 1 != 0))
+        nuevo = numero.where(texto != "", m[f"{tipo}_antes"]).where(~invalido)
+        fuera = existe & ~invalido & ((nuevo < 0) | (nuevo > m[f"{tipo}_total"]))
+        reglas.append((invalido, pd.Series(f"{etiqueta} tomadas no es un numero entero", index=m.index)))
+        reglas.append((fuera, f"{etiqueta} tomadas fuera de 0 a " + m[f"{tipo}_total"].astype("Int64").astype(str)))
+        m[f"{tipo}_nuevo"] = nuevo.astype("Int64")
+
+    motivo = pd.Series("", index=m.index)
+    for mascara, texto in reversed(reglas):
+        motivo = motivo.mask(mascara.fillna(False), texto)
+    cambia = (m["def_nuevo"] != m["def_antes"]) | (m["int_nuevo"] != m["int_antes"])
+    m["estado"] = "sin cambio"
+    m.loc[cambia.fillna(False), "estado"] = "cambio"
+    m.loc[motivo != "", "estado"] = "error"
+    m["motivo"] = motivo
+    columnas = ["renglon", "zona", "especialidad", "def_antes", "def_nuevo", "int_antes", "int_nuevo", "estado", "motivo"]
+    return m[columnas].astype({"def_antes": "Int64", "int_antes": "Int64"})
+
+
+# -----------------------------------------------
+# COPIA LOCAL DEL SNAPSHOT (Parquet)
+# -----------------------------------------------
+# Version del formato de la copia; una copia de otro formato se ignora
+FORMATO_COPIA = 1
+# Clave de los metadatos del esquema Parquet donde va la cabecera (JSON)
+CLAVE_CABECERA = b"draft_imss"
+
+
+def escribir_atomico(ruta, contenido):
+    """Escribe a un temporal del mismo directorio y lo renombra: un lector nunca ve un archivo a medias."""
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=ruta.parent, prefix=f".{ruta.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenido)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+
+
+def guardar_copia(ruta, df, cabecera):
+    """Guarda las plazas en Parquet con `cabecera` (dict serializable) en los metadatos del esquema.
+
+    Requiere pyarrow. Los tipos compactos (int16, categorias) se conservan.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    cabecera = {**cabecera, "formato": FORMATO_COPIA, "columnas": list(df.columns)}
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}), CLAVE_CABECERA: json.dumps(cabecera, ensure_ascii=False).encode("utf-8"),
+    })
+    buffer = BytesIO()
+    pq.write_table(tabla, buffer)
+    escribir_atomico(ruta, buffer.getvalue())
+
+
+def leer_copia(ruta):
+    """Retorna (df, cabecera) de una copia de guardar_copia, o None si no existe o no se puede usar.
+
+    Se descarta si esta dañada, es de otro FORMATO_COPIA o le faltan columnas.
+    """
+    ruta = Path(ruta)
+    if not ruta.exists():
+        return None
+    try:
+        import pyarrow.parquet as pq
+
+        tabla = pq.read_table(ruta)
+        cabecera = json.loads(tabla.schema.metadata[CLAVE_CABECERA])
+        df = tabla.to_pandas()
+    except Exception:
+        return None
+    requeridas = COLUMNAS_CATEGORIA + COLUMNAS_CONTEO + ["def_disp", "int_disp", "total_disp"]
+    if cabecera.get("formato") != FORMATO_COPIA or list(df.columns) != cabecera.get("columnas") \
+            or any(c not in df.columns for c in requeridas):
+        return None
+    return df, cabecera
+
+
+# -----------------------------------------------
+# CONTROL DE LLAMADAS (cuota, reintentos, circuito)
+# -----------------------------------------------
+
+class ErrorTransitorio(Exception):
+    """Sheets no respondio a tiempo; el dato guardado no cambio y se puede volver a intentar."""
+
+
+class CuotaAgotada(ErrorTransitorio):
+    """La cuota por minuto no libera lugar dentro de la espera permitida."""
+
+
+class CircuitoAbierto(ErrorTransitorio):
+    """Llamada cancelada sin tocar Sheets porque el circuito esta abierto."""
+
+
+def _es_transitorio(error):
+    from requests import exceptions as req
+
+    if isinstance(error, (req.ConnectionError, req.Timeout, ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "code", None) in CODIGOS_TRANSITORIOS
+
+
+def _espera_sugerida(error):
+    """Segundos del encabezado Retry-After de la respuesta, si Google lo envia."""
+    try:
+        return float(error.response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LimiteCuota:
+    """Ventana deslizante de 60 s con a lo mas `por_minuto` solicitudes (0 = sin limite)."""
+
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self._marcas = deque()
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora):
+        while self._marcas and ahora - self._marcas[0] >= 60:
+            self._marcas.popleft()
+
+    def en_uso(self):
+        """Solicitudes registradas en el ultimo minuto."""
+        with self._lock:
+            self._purgar(time.monotonic())
+            return len(self._marcas)
+
+    def adquirir(self, n=1, espera_max=30.0):
+        """Reserva `n` solicitudes, esperando a que la ventana tenga lugar; retorna los segundos esperados."""
+        if n <= 0 or not self.por_minuto:
+            return 0.0
+        n = min(n, self.por_minuto)
+        esperado = 0.0
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._purgar(ahora)
+                sobran = len(self._marcas) + n - self.por_minuto
+                if sobran <= 0:
+                    self._marcas.extend([ahora] * n)
+                    return esperado
+                espera = self._marcas[sobran - 1] + 60 - ahora
+            if esperado + espera > espera_max:
+                raise CuotaAgotada(f"Cuota de Google Sheets agotada ({self.por_minuto} solicitudes/min)")
+            time.sleep(espera)
+            esperado += espera
+
+
+class ControlLlamadas:
+    """Envoltura comun de toda operacion contra Sheets.
+
+    - Cuota: ventanas de 60 s separadas para lecturas y escrituras; si se llenan, la operacion espera.
+    - Reintentos: errores 429/5xx y de red se reintentan con espera exponencial con jitter
+      (o la que indique Retry-After).
+    - Circuito: tras `fallos_para_abrir` operaciones fallidas seguidas, las llamadas se cancelan
+      de inmediato durante `enfriamiento` s; despues pasa una de prueba y, si responde, se cierra.
+      Mientras tanto la app sigue sirviendo el ultimo snapshot bueno.
+    """
+
+    def __init__(self, lecturas_por_minuto=60, escrituras_por_minuto=60, reintentos=4,
+                 espera_base=0.5, espera_max=16.0, fallos_para_abrir=5, enfriamiento=30.0):
+        self.cuota = {"lectura": LimiteCuota(lecturas_por_minuto), "escritura": LimiteCuota(escrituras_por_minuto)}
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.fallos_para_abrir = fallos_para_abrir
+        self.enfriamiento = enfriamiento
+        self.contadores = Counter()
+        self._fallos_seguidos = 0
+        self._abierto_hasta = None
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def _contar(self, clave, valor=1):
+        with self._lock:
+            self.contadores[clave] += valor
+
+    def _permitir(self):
+        with self._lock:
+            if self._abierto_hasta is None:
+                return
+            restante = self._abierto_hasta - time.monotonic()
+            if restante > 0 or self._prueba_en_curso:
+                self.contadores["canceladas_circuito"] += 1
+                raise CircuitoAbierto(f"Google Sheets no responde; nuevo intento en {max(restante, 0):.0f} s")
+            self._prueba_en_curso = True
+
+    def _registrar(self, exito):
+        """exito=None: la operacion no llego a Sheets (cuota), no cuenta para el circuito."""
+        with self._lock:
+            self._prueba_en_curso = False
+            if exito is None:
+                return
+            if exito:
+                self._fallos_seguidos = 0
+                self._abierto_hasta = None
+                return
+            self._fallos_seguidos += 1
+            if self._abierto_hasta is not None or self._fallos_seguidos >= self.fallos_para_abrir:
+                self._abierto_hasta = time.monotonic() + self.enfriamiento
+                self.contadores["aperturas_circuito"] += 1
+
+    def _con_reintentos(self, funcion, lecturas, escrituras):
+        for intento in range(self.reintentos + 1):
+            espera = (self.cuota["lectura"].adquirir(lecturas)
+                      + self.cuota["escritura"].adquirir(escrituras))
+            with self._lock:
+                self.contadores["lecturas"] += lecturas
+                self.contadores["escrituras"] += escrituras
+                if espera:
+                    self.contadores["espera_cuota_s"] += espera
+            try:
+                return funcion()
+            except Exception as e:
+                if not _es_transitorio(e):
+                    raise
+                ultimo = e
+                self._contar(f"error_{getattr(e, 'code', None) or 'red'}")
+            if intento < self.reintentos:
+                self._contar("reintentos")
+                tope = min(self.espera_max, self.espera_base * 2 ** intento)
+                time.sleep(min(self.espera_max, _espera_sugerida(ultimo) or tope / 2 + random.uniform(0, tope / 2)))
+        raise ErrorTransitorio(f"Google Sheets no respondio tras {self.reintentos + 1} intentos ({ultimo})") from ultimo
+
+    def ejecutar(self, funcion, lecturas=1, escrituras=0):
+        """Ejecuta funcion() contando `lecturas`/`escrituras` contra la cuota."""
+        self._permitir()
+        try:
+            resultado = self._con_reintentos(funcion, lecturas, escrituras)
+        except CuotaAgotada:
+            self._registrar(None)
+            raise
+        except ErrorTransitorio:
+            self._registrar(False)
+            raise
+        except Exception:
+            # Sheets respondio (p. ej. 400): el servicio esta sano aunque la operacion falle
+            self._registrar(True)
+            raise
+        self._registrar(True)
+        return resultado
+
+    def estado(self):
+        """'cerrado', 'abierto' o 'semiabierto' (esperando la llamada de prueba)."""
+        with self._lock:
+            if self._abierto_hasta is None:
+                return "cerrado"
+            return "abierto" if time.monotonic() < self._abierto_hasta else "semiabierto"
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self.contadores)
+        datos["circuito"] = self.estado()
+        datos["cuota_lecturas_min"] = f"{self.cuota['lectura'].en_uso()}/{self.cuota['lectura'].por_minuto or '∞'}"
+        datos["cuota_escrituras_min"] = f"{self.cuota['escritura'].en_uso()}/{self.cuota['escritura'].por_minuto or '∞'}"
+        return datos
+
+
+# -----------------------------------------------
+# GOOGLE SHEETS
+# -----------------------------------------------
+
+class ConexionSheets:
+    """Cliente autenticado y handles de spreadsheet/hojas compartidos por el proceso.
+
+    Se crea una sola vez y se reutiliza en todos los reruns y sesiones: el token
+    se refresca solo cuando expira y, si Google rechaza la autenticacion, se
+    descarta todo y se vuelve a autorizar.
+    """
+
+    def __init__(self, info_cuenta, spreadsheet_id, control=None):
+        self._info_cuenta = info_cuenta
+        self.spreadsheet_id = spreadsheet_id
+        self.control = control or ControlLlamadas()
+        self._lock = threading.RLock()
+        self._creds = None
+        self._client = None
+        self._sh = None
+        self._hojas = {}
+
+    def _autorizar(self):
+        # Importaciones diferidas: un proceso con otro backend no paga su costo
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from requests.adapters import HTTPAdapter
+
+        self._creds = Credentials.from_service_account_info(self._info_cuenta, scopes=SCOPES)
+        self._client = gspread.authorize(self._creds)
+        # Sesion HTTP con pool de conexiones keep-alive para llamadas concurrentes
+        adaptador = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self._client.http_client.session.mount("https://", adaptador)
+
+    def client(self):
+        """Retorna el cliente gspread, autorizando o refrescando el token si hace falta."""
+        with self._lock:
+            if self._client is None:
+                self._autorizar()
+            if not self._creds.valid:
+                self._client.http_client.login()
+            return self._client
+
+    def spreadsheet(self):
+        """Retorna el handle del spreadsheet (open_by_key solo la primera vez)."""
+        with self._lock:
+            client = self.client()
+            if self._sh is None:
+                self._sh = client.open_by_key(self.spreadsheet_id)
+            return self._sh
+
+    def hoja(self, nombre):
+        """Retorna el handle de una hoja por nombre, cacheado tras la primera busqueda."""
+        with self._lock:
+            if nombre not in self._hojas:
+                self._hojas[nombre] = self.spreadsheet().worksheet(nombre)
+            return self._hojas[nombre]
+
+    def existe_hoja(self, nombre):
+        from gspread.exceptions import WorksheetNotFound
+
+        try:
+            self.hoja(nombre)
+            return True
+        except WorksheetNotFound:
+            return False
+
+    def asegurar_hoja(self, nombre, encabezado):
+        """Handle de la hoja `nombre`, creandola con `encabezado` si todavia no existe."""
+        from gspread.exceptions import WorksheetNotFound
+
+        with self._lock:
+            try:
+                return self.hoja(nombre)
+            except WorksheetNotFound:
+                hoja = self.spreadsheet().add_worksheet(nombre, rows=1000, cols=len(encabezado))
+                self.spreadsheet().values_update(f"'{nombre}'!A1", params={"valueInputOption": "RAW"},
+                                                 body={"values": [encabezado]})
+                self._hojas[nombre] = hoja
+                return hoja
+
+    def invalidar(self):
+        """Descarta credenciales y handles; la siguiente llamada vuelve a autorizar."""
+        with self._lock:
+            self._creds = None
+            self._client = None
+            self._sh = None
+            self._hojas = {}
+
+    def ejecutar(self, operacion, lecturas=1, escrituras=0):
+        """Ejecuta operacion(conexion) a traves del control de llamadas."""
+        return self.control.ejecutar(lambda: self._autenticado(operacion), lecturas, escrituras)
+
+    def _autenticado(self, operacion):
+        """Ejecuta operacion(conexion), reintentando una vez si falla la autenticacion."""
+        from gspread.exceptions import APIError
+        from google.auth.exceptions import RefreshError
+
+        try:
+            return operacion(self)
+        except (RefreshError, APIError) as e:
+            if isinstance(e, APIError) and e.code not in (401, 403):
+                raise
+            self.invalidar()
+            return operacion(self)
+
+
+def _celda(hoja, fila, columna):
+    letras = ""
+    while columna:
+        columna, resto = divmod(columna - 1, 26)
+        letras = chr(65 + resto) + letras
+    return f"'{hoja}'!{letras}{fila}"
+
+
+def _rango_columna(hoja, columna, primera, ultima):
+    """'Hoja'!C5:C9: una columna de la fila `primera` a la `ultima`."""
+    return _celda(hoja, primera, columna) + ":" + _celda(hoja, ultima, columna).partition("!")[2]
+
+
+class HojaInvalida(ValueError):
+    """La hoja Plazas no tiene la forma esperada (p. ej. le faltan columnas)."""
+
+
+def parsear_plazas(valores):
+    """DataFrame tipado e indice de filas desde la cuadricula cruda de Plazas (filas de texto).
+
+    Valida el encabezado, toma solo las columnas que se usan y convierte los
+    conteos en bloque (int16) y zona/especialidad a categorias, sin pasar por
+    registros. Las filas en blanco se omiten. Las que tienen datos invalidos se
+    reportan en indice["problemas"] como (fila, motivo): sin zona o
+    especialidad, plaza repetida (se conserva la primera), conteo que no es un
+    entero >= 0 (queda en 0) o mas tomadas que el total.
+    """
+    if not valores:
+        raise HojaInvalida("La hoja Plazas esta vacia")
+    encabezado = [str(c).strip().lower() for c in valores[0]]
+    faltan = [c for c in COLUMNAS_CATEGORIA + COLUMNAS_CONTEO if c not in encabezado]
+    if faltan:
+        raise HojaInvalida("A la hoja Plazas le faltan las columnas: " + ", ".join(faltan))
+
+    filas = valores[1:]
+    numero_fila = np.arange(2, len(filas) + 2)
+
+    # Las filas llegan disparejas (la API omite las celdas vacias al final): el
+    # constructor las rellena con None. Solo se conservan las columnas que se usan.
+    posiciones = [encabezado.index(c) for c in COLUMNAS_CATEGORIA + COLUMNAS_CONTEO]
+    cuadricula = pd.DataFrame(filas).reindex(columns=posiciones)
+    columnas_texto = [cuadricula[i].fillna("").astype(str).str.strip() for i in posiciones]
+
+    zona, especialidad = columnas_texto[:2]
+    texto = pd.concat(columnas_texto[2:], ignore_index=True)
+    # Una sola conversion para los cuatro conteos: los digitos simples (casi todas las
+    # celdas) se convierten en bloque; solo el resto pasa por to_numeric
+    digitos = texto.str.fullmatch(r"[0-9]{1,9}")
+    numeros = texto.where(digitos, "0").astype("float64")
+    resto = ~digitos & (texto != "")
+    if resto.any():
+        numeros[resto] = pd.to_numeric(texto[resto], errors="coerce")
+    numeros = numeros.to_numpy(dtype=float, na_value=np.nan).reshape(4, -1).T
+    vacio = (texto == "").to_numpy().reshape(4, -1).T
+    invalido = ~vacio & ~(np.isfinite(numeros) & (numeros % 1 == 0) & (numeros >= 0))
+    conteos = np.where(invalido | vacio, 0, np.nan_to_num(numeros)).clip(0, 32767).astype(TIPO_CONTEO)
+
+    sin_zona, sin_especialidad = (zona == "").to_numpy(), (especialidad == "").to_numpy()
+    en_blanco = sin_zona & sin_especialidad & vacio.all(axis=1)
+    sin_clave = ~en_blanco & (sin_zona | sin_especialidad)
+    repetida = ~en_blanco & ~sin_clave & pd.MultiIndex.from_arrays([zona, especialidad]).duplicated(keep="first")
+    columnas = dict(zip(COLUMNAS_CONTEO, conteos.T))
+    excedida = (columnas["def_tomadas"] > columnas["def_total"]) | (columnas["int_tomadas"] > columnas["int_total"])
+
+    problemas = []
+    for mascara, motivo in [
+        (sin_clave, "falta zona o especialidad"),
+        (repetida, "plaza repetida; se usa la primera"),
+        (~en_blanco & invalido.any(axis=1), "conteo que no es un entero >= 0; se toma como 0"),
+        (~en_blanco & excedida, "mas plazas tomadas que el total"),
+    ]:
+        problemas += [(int(f), motivo) for f in numero_fila[mascara]]
+    problemas.sort()
+
+    usar = ~(en_blanco | sin_clave | repetida)
+    df = pd.DataFrame({
+        "zona": pd.Categorical(zona[usar]),
+        "especialidad": pd.Categorical(especialidad[usar]),
+        **{col: valores_col[usar] for col, valores_col in columnas.items()},
+    })
+    indice = {
+        "filas": dict(zip(zip(zona[usar].tolist(), especialidad[usar].tolist()), numero_fila[usar].tolist())),
+        "columnas": {col: encabezado.index(col) + 1 for col in ["zona", "especialidad", "def_tomadas", "int_tomadas"]},
+        "problemas": problemas,
+    }
+    return agregar_disponibles(df), indice
+
+
+def parsear_config(valores):
+    """Config (clave -> valor) y la fila de cada clave, para escribir sin buscar."""
+    config = {row[0]: row[1] for row in valores if len(row) >= 2}
+    config_filas = {row[0]: i for i, row in enumerate(valores, start=1) if row and row[0]}
+    return config, config_filas
+
+
+RANGO_PLAZAS = "Plazas"
+RANGO_CONFIG = "'Config'!A:B"
+
+
+def _leer_plazas(conexion):
+    return parsear_plazas(conexion.spreadsheet().values_get(RANGO_PLAZAS).get("values", []))
+
+
+def _leer_config(conexion):
+    return parsear_config(conexion.spreadsheet().values_get(RANGO_CONFIG).get("values", []))
+
+
+def _leer_completo(conexion):
+    """Plazas y Config en una sola solicitud: retorna (config, config_filas, df, indice)."""
+    plazas, config = conexion.spreadsheet().values_batch_get([RANGO_PLAZAS, RANGO_CONFIG])["valueRanges"]
+    return (*parsear_config(config.get("values", [])), *parsear_plazas(plazas.get("values", [])))
+
+
+def _celdas_revision(config_filas):
+    """Rangos que registran un guardado en Config: timestamp y nueva revision."""
+    fila_ts = config_filas.get("ultima_actualizacion", 2)
+    timestamp, revision = _marca_guardado()
+    if "revision" in config_filas:
+        rango_rev = {"range": _celda("Config", config_filas["revision"], 2), "values": [[revision]]}
+    else:
+        fila_rev = max(config_filas.values(), default=2) + 1
+        rango_rev = {"range": _celda("Config", fila_rev, 1), "values": [["revision", revision]]}
+    return [
+        {"range": _celda("Config", fila_ts, 2), "values": [[timestamp]]},
+        rango_rev,
+    ]
+
+
+def _indice_completo(conexion):
+    """Indice de filas de Plazas y de Config leido de la hoja."""
+    config_filas, indice_plazas = _leer_completo(conexion)[1::2]
+    return {**indice_plazas, "config": config_filas}
+
+
+def _ids_anotados(conexion):
+    """Ids de Toma que ya tienen eventos en la bitacora."""
+    if not conexion.existe_hoja("Eventos"):
+        return set()
+    valores = conexion.spreadsheet().values_get("'Eventos'!I2:I").get("values", [])
+    return {f[0] for f in valores if f}
+
+
+def _leer_actuales(conexion, idx, tomas):
+    """Lee zona, especialidad y tomadas de la fila de cada toma segun `idx`.
+
+    Retorna (validas, {clave: (def, int)}) con las tomas cuya plaza esta en el
+    indice, o (validas, None) si alguna fila ya no tiene la zona y especialidad
+    que el indice dice (la hoja se edito a mano).
+    Lee cuatro rangos (una columna cada uno, de la primera a la ultima fila del
+    lote) sin importar cuantas tomas haya: una celda por toma alargaria la
+    URL de la lectura sin limite en una carga masiva.
+    """
+    validas = [t for t in tomas if t.clave in idx["filas"]]
+    if not validas:
+        return validas, {}
+    filas = [idx["filas"][t.clave] for t in validas]
+    primera, ultima = min(filas), max(filas)
+    columnas = [idx["columnas"][c] for c in ("zona", "especialidad", "def_tomadas", "int_tomadas")]
+    rangos = [_rango_columna("Plazas", col, primera, ultima) for col in columnas]
+    leidos = [r.get("values", []) for r in conexion.spreadsheet().values_batch_get(rangos)["valueRanges"]]
+
+    def celda(valores, fila):
+        # Sheets omite las filas vacias del final del rango y deja [] en las de en medio
+        renglon = valores[fila - primera] if fila - primera < len(valores) else []
+        return renglon[0] if renglon else ""
+
+    actuales = {}
+    for t, fila in zip(validas, filas):
+        zona, especialidad, def_actual, int_actual = (celda(valores, fila) for valores in leidos)
+        if (str(zona).strip(), str(especialidad).strip()) != t.clave:
+            return validas, None
+        actuales[t.clave] = (_entero(def_actual), _entero(int_actual))
+    return validas, actuales
+
+
+class BackendSheets(BackendDatos):
+    """Google Sheets: hoja Plazas (una fila por zona/especialidad) y hoja Config (clave/valor)."""
+
+    nombre = "Google Sheets"
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.origen = getattr(conexion, "spreadsheet_id", None)
+
+    def leer_config(self):
+        return self.conexion.ejecutar(_leer_config)
+
+    def cargar_plazas(self):
+        return self.conexion.ejecutar(_leer_plazas)
+
+    def cargar_completo(self):
+        return self.conexion.ejecutar(_leer_completo)
+
+    def aplicar_tomas(self, tomas, indice=None):
+        """Verifica los valores esperados con una lectura y escribe el lote con una sola escritura.
+
+        Usa el indice de filas del snapshot cargado; si no se recibe o ya no contiene
+        alguna plaza (p. ej. se editaron filas a mano), se reconstruye leyendo la hoja.
+        La verificacion y la escritura no son atomicas en Sheets: dentro del proceso
+        las serializa la cola de escrituras. Los eventos se anotan despues de los
+        conteos con el id de su Toma, asi un reintento (de la llamada o de la cola)
+        no los repite.
+        """
+        def _aplicar(conexion):
+            idx = indice
+            if idx is None or any(t.clave not in idx["filas"] for t in tomas):
+                idx = _indice_completo(conexion)
+            validas, actuales = _leer_actuales(conexion, idx, tomas)
+            if actuales is None:
+                # Filas insertadas o movidas a mano: el indice ya no apunta a estas plazas
+                idx = _indice_completo(conexion)
+                validas, actuales = _leer_actuales(conexion, idx, tomas)
+                if actuales is None:
+                    return {t.clave: "La hoja Plazas se está editando; intenta de nuevo en unos segundos"
+                            for t in tomas}
+            col_def, col_int = idx["columnas"]["def_tomadas"], idx["columnas"]["int_tomadas"]
+
+            rechazos = {t.clave: f"No existe la plaza {t.zona} / {t.especialidad} en la hoja Plazas"
+                        for t in tomas if t.clave not in idx["filas"]}
+            for t in validas:
+                motivo = t.conflicto(*actuales[t.clave])
+                if motivo:
+                    rechazos[t.clave] = motivo
+            aceptadas = [t for t in validas if t.clave not in rechazos]
+            if not aceptadas:
+                return rechazos
+
+            # Con los valores que vio el operador: en un reintento la hoja ya puede tener los nuevos
+            ts = _marca_evento()
+            eventos = {t.id: t.eventos(*(actuales[t.clave] if t.esperado_def is None
+                                         else (t.esperado_def, t.esperado_int)), ts) for t in aceptadas}
+            # Si la hoja ya tiene el valor nuevo, un intento anterior pudo escribirlo y
+            # anotar sus eventos: solo entonces se revisan los ids de la bitacora
+            ya_escritas = [t.id for t in aceptadas
+                           if eventos[t.id] and actuales[t.clave] == (t.def_tomadas, t.int_tomadas)]
+            if ya_escritas:
+                anotadas = _ids_anotados(conexion)
+                eventos = {i: filas for i, filas in eventos.items() if i not in anotadas}
+
+            datos = []
+            for t in aceptadas:
+                fila = idx["filas"][t.clave]
+                datos.append({"range": _celda("Plazas", fila, col_def), "values": [[int(t.def_tomadas)]]})
+                datos.append({"range": _celda("Plazas", fila, col_int), "values": [[int(t.int_tomadas)]]})
+            conexion.spreadsheet().values_batch_update({
+                "valueInputOption": "USER_ENTERED",
+                "data": datos + _celdas_revision(idx["config"]),
+            })
+            # Eventos solo despues de guardar los conteos: la bitacora nunca anota una toma
+            # que no se guardo. Un lector que vea la revision nueva antes que sus eventos
+            # relee la tabla completa (ver RefrescadorSnapshot).
+            filas = [fila + [i] for i, filas_toma in eventos.items() for fila in filas_toma]
+            if filas:
+                conexion.asegurar_hoja("Eventos", COLUMNAS_EVENTO_HOJA)
+                conexion.spreadsheet().values_append(
+                    "'Eventos'!A:I", params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"},
+                    body={"values": filas},
+                )
+            return rechazos
+
+        return self.conexion.ejecutar(_aplicar, lecturas=1, escrituras=2)
+
+    def leer_eventos(self, desde=0):
+        """Lee solo las filas de Eventos posteriores a `desde` (filas ya leidas, vacias incluidas).
+
+        Sin hoja Eventos (nadie ha guardado aun) no hay eventos; leer no la crea,
+        asi basta una cuenta de solo lectura para mostrar los datos.
+        """
+        def _leer(conexion):
+            if not conexion.existe_hoja("Eventos"):
+                return [], desde
+            valores = conexion.spreadsheet().values_get(f"'Eventos'!A{desde + 2}:H").get("values", [])
+            # El cursor cuenta tambien las filas borradas a mano, para no volver a leer las siguientes
+            return [f for f in valores if any(f)], desde + len(valores)
+
+        return self.conexion.ejecutar(_leer)
+
+    def fijar_dia(self, dia, indice=None):
+        fila = indice["config"].get("dia_evento", 1) if indice else 1
+        self.conexion.ejecutar(lambda conexion: conexion.spreadsheet().values_update(
+            _celda("Config", fila, 2), params={"valueInputOption": "USER_ENTERED"}, body={"values": [[int(dia)]]}
+        ), lecturas=0, escrituras=1)
+
+    def metricas(self):
+        return self.conexion.control.metricas()
+
+
+# -----------------------------------------------
+# SHEETS SIMULADO (en memoria)
+# -----------------------------------------------
+
+ESPECIALIDADES_MUESTRA = [
+    "Anestesiología", "Cardiología", "Cirugía General", "Cirugía Pediátrica", "Dermatología",
+    "Endocrinología", "Gastroenterología", "Geriatría", "Ginecología y Obstetricia", "Hematología",
+    "Imagenología", "Medicina del Enfermo en Estado Crítico", "Medicina de Urgencias", "Medicina Familiar",
+    "Medicina Física y Rehabilitación", "Medicina Interna", "Nefrología", "Neonatología", "Neumología",
+    "Neurocirugía", "Neurología", "Oftalmología", "Oncología Médica", "Ortopedia y Traumatología",
+    "Otorrinolaringología", "Patología Clínica", "Pediatría", "Psiquiatría", "Reumatología", "Urología",
+]
+
+
+def plazas_sinteticas(filas, semilla=2026):
+    """Valores de una hoja Plazas de `filas` renglones (encabezado incluido), reproducibles por semilla."""
+    rnd = random.Random(semilla)
+    valores = [["zona", "especialidad"] + COLUMNAS_CONTEO]
+    for i in range(filas):
+        zona = f"HGZ {i // len(ESPECIALIDADES_MUESTRA) + 1}"
+        especialidad = ESPECIALIDADES_MUESTRA[i % len(ESPECIALIDADES_MUESTRA)]
+        def_total, int_total = rnd.randint(0, 4), rnd.randint(0, 3)
+        valores.append([zona, especialidad, str(def_total), str(int_total),
+                        str(rnd.randint(0, def_total)), str(rnd.randint(0, int_total))])
+    return valores
+
+
+def _columna_a_numero(letras):
+    numero = 0
+    for letra in letras:
+        numero = numero * 26 + ord(letra) - 64
+    return numero
+
+
+def _rango_a1(rango):
+    """'Hoja'!A1:B5 -> (hoja, fila_ini, col_ini, fila_fin, col_fin); None = hasta el final."""
+    hoja, _, celdas = rango.partition("!")
+    hoja = hoja.strip("'")
+    if not celdas:
+        return hoja, 1, 1, None, None
+    m = re.fullmatch(r"([A-Z]+)?(\d+)?(?::([A-Z]+)?(\d+)?)?", celdas)
+    col_ini = _columna_a_numero(m.group(1)) if m.group(1) else 1
+    fila_ini = int(m.group(2)) if m.group(2) else 1
+    if ":" in celdas:
+        col_fin = _columna_a_numero(m.group(3)) if m.group(3) else None
+        fila_fin = int(m.group(4)) if m.group(4) else None
+    else:
+        col_fin, fila_fin = col_ini, fila_ini
+    return hoja, fila_ini, col_ini, fila_fin, col_fin
+
+
+class _HojaSimulada:
+    def __init__(self, libro, titulo):
+        self._libro = libro
+        self.title = titulo
+
+    def get_all_values(self):
+        self._libro._llamada("get_all_values")
+        return self._libro._leer(self.title)
+
+
+class ErrorSimulado(Exception):
+    """Error HTTP simulado, con el mismo atributo `code` que gspread.exceptions.APIError."""
+
+    def __init__(self, code):
+        super().__init__(f"APIError simulado [{code}]")
+        self.code = code
+
+
+class SheetsSimulado:
+    """Spreadsheet en memoria con el subconjunto de la API de gspread que usa BackendSheets.
+
+    Cuenta las llamadas por metodo y puede simular latencia de red, errores 429
+    aleatorios (`tasa_fallos`) o una caida completa (`caido`), para pruebas de
+    carga y benchmarks sin conexion.
+    """
+
+    def __init__(self, hojas, latencia=0.0, tasa_fallos=0.0):
+        self._hojas = {nombre: [list(map(str, fila)) for fila in valores] for nombre, valores in hojas.items()}
+        self.latencia = latencia
+        self.tasa_fallos = tasa_fallos
+        self.caido = False
+        self.llamadas = Counter()
+        self._lock = threading.Lock()
+
+    def _llamada(self, metodo):
+        with self._lock:
+            self.llamadas[metodo] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.caido:
+            raise ErrorSimulado(503)
+        if self.tasa_fallos and random.random() < self.tasa_fallos:
+            raise ErrorSimulado(429)
+
+    def _leer(self, rango):
+        hoja, fila_ini, col_ini, fila_fin, col_fin = _rango_a1(rango)
+        with self._lock:
+            filas = self._hojas[hoja][fila_ini - 1:fila_fin]
+            valores = [list(fila[col_ini - 1:col_fin]) for fila in filas]
+        while valores and not any(valores[-1]):
+            valores.pop()
+        return valores
+
+    def _escribir(self, rango, valores):
+        hoja, fila_ini, col_ini, _, _ = _rango_a1(rango)
+        with self._lock:
+            filas = self._hojas[hoja]
+            for i, fila_valores in enumerate(valores):
+                while len(filas) < fila_ini + i:
+                    filas.append([])
+                fila = filas[fila_ini + i - 1]
+                for j, valor in enumerate(fila_valores):
+                    while len(fila) < col_ini + j:
+                        fila.append("")
+                    fila[col_ini + j - 1] = str(valor)
+
+    # --- API tipo gspread ---
+    def worksheet(self, nombre):
+        self._llamada("worksheet")
+        if nombre not in self._hojas:
+            raise KeyError(nombre)
+        return _HojaSimulada(self, nombre)
+
+    def values_get(self, rango, params=None):
+        self._llamada("values_get")
+        return {"range": rango, "values": self._leer(rango)}
+
+    def values_batch_get(self, rangos, params=None):
+        self._llamada("values_batch_get")
+        return {"valueRanges": [{"range": r, "values": self._leer(r)} for r in rangos]}
+
+    def values_update(self, rango, params=None, body=None):
+        self._llamada("values_update")
+        self._escribir(rango, body["values"])
+        return {"updatedRange": rango}
+
+    def add_worksheet(self, title, rows=1000, cols=26):
+        self._llamada("add_worksheet")
+        with self._lock:
+            self._hojas.setdefault(title, [])
+        return _HojaSimulada(self, title)
+
+    def values_append(self, rango, params=None, body=None):
+        self._llamada("values_append")
+        hoja = _rango_a1(rango)[0]
+        with self._lock:
+            filas = self._hojas[hoja]
+            while filas and not any(filas[-1]):
+                filas.pop()
+            filas.extend([list(map(str, fila)) for fila in body["values"]])
+        return {"updates": {"updatedRows": len(body["values"])}}
+
+    def values_batch_update(self, body=None):
+        self._llamada("values_batch_update")
+        for bloque in body["data"]:
+            self._escribir(bloque["range"], bloque["values"])
+        return {"totalUpdatedCells": sum(len(f) for b in body["data"] for f in b["values"])}
+
+
+class ConexionSimulada:
+    """Misma interfaz que ConexionSheets, sobre un SheetsSimulado."""
+
+    def __init__(self, libro, control=None):
+        self.libro = libro
+        self.control = control or ControlLlamadas()
+
+    def spreadsheet(self):
+        return self.libro
+
+    def hoja(self, nombre):
+        return _HojaSimulada(self.libro, nombre)
+
+    def existe_hoja(self, nombre):
+        return nombre in self.libro._hojas
+
+    def asegurar_hoja(self, nombre, encabezado):
+        if nombre not in self.libro._hojas:
+            self.libro.add_worksheet(nombre)
+            self.libro.values_update(f"'{nombre}'!A1", body={"values": [encabezado]})
+        return self.hoja(nombre)
+
+    def invalidar(self):
+        pass
+
+    def ejecutar(self, operacion, lecturas=1, escrituras=0):
+        return self.control.ejecutar(lambda: operacion(self), lecturas, escrituras)
+
+
+# Libros simulados del proceso por identificador, para que un benchmark pueda sembrarlos y leer sus contadores
+LIBROS_SIMULADOS = {}
+_lock_libros = threading.Lock()
+
+
+def libro_simulado(identificador="default", filas=200, latencia=0.0, tasa_fallos=0.0):
+    """Retorna (creandolo si no existe) el libro simulado `identificador`."""
+    with _lock_libros:
+        if identificador not in LIBROS_SIMULADOS:
+            LIBROS_SIMULADOS[identificador] = SheetsSimulado({
+                "Plazas": plazas_sinteticas(filas),
+                "Config": [["dia_evento", "1"], ["ultima_actualizacion", "Sin actualizaciones aun"]],
+            }, latencia=latencia, tasa_fallos=tasa_fallos)
+        return LIBROS_SIMULADOS[identificador]
+
+
+# -----------------------------------------------
+# SQLITE LOCAL
+# -----------------------------------------------
+
+class BackendSQLite(BackendDatos):
+    """Base SQLite local: lecturas sin red y guardados transaccionales.
+
+    La tabla plazas tiene llave primaria (zona, especialidad), asi que cada
+    guardado es una busqueda indexada; Config vive en una tabla clave/valor.
+    """
+
+    nombre = "SQLite"
+
+    def __init__(self, ruta, semilla=None):
+        self.ruta = ruta
+        self.origen = os.path.abspath(ruta)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS plazas (
+                    zona TEXT NOT NULL, especialidad TEXT NOT NULL,
+                    def_total INTEGER NOT NULL DEFAULT 0, int_total INTEGER NOT NULL DEFAULT 0,
+                    def_tomadas INTEGER NOT NULL DEFAULT 0, int_tomadas INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (zona, especialidad)
+                )""")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS config (clave TEXT PRIMARY KEY, valor TEXT)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS eventos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, dia INTEGER NOT NULL,
+                    zona TEXT NOT NULL, especialidad TEXT NOT NULL, tipo TEXT NOT NULL,
+                    delta INTEGER NOT NULL, valor INTEGER NOT NULL, operador TEXT NOT NULL DEFAULT ''
+                )""")
+            self._conn.execute("INSERT OR IGNORE INTO config VALUES ('dia_evento', '1')")
+        if semilla and self._vacia():
+            self.importar(pd.read_csv(semilla, dtype={"zona": str, "especialidad": str}))
+
+    def _vacia(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM plazas").fetchone()[0] == 0
+
+    def _registrar_guardado(self):
+        timestamp, revision = _marca_guardado()
+        self._conn.executemany("INSERT OR REPLACE INTO config VALUES (?, ?)",
+                               [("ultima_actualizacion", timestamp), ("revision", revision)])
+
+    def importar(self, df):
+        """Reemplaza el catalogo de plazas con las columnas de un DataFrame tipo hoja Plazas."""
+        filas = completar_columnas(df.copy())[["zona", "especialidad"] + COLUMNAS_CONTEO]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM plazas")
+            self._conn.executemany("INSERT INTO plazas VALUES (?, ?, ?, ?, ?, ?)",
+                                   filas.itertuples(index=False, name=None))
+            self._registrar_guardado()
+
+    def leer_config(self):
+        with self._lock:
+            config = dict(self._conn.execute("SELECT clave, valor FROM config").fetchall())
+        return config, {}
+
+    def cargar_plazas(self):
+        with self._lock:
+            df = pd.read_sql_query(
+                "SELECT zona, especialidad, def_total, int_total, def_tomadas, int_tomadas FROM plazas ORDER BY rowid",
+                self._conn,
+            )
+        return completar_columnas(df), {}
+
+    def aplicar_tomas(self, tomas, indice=None):
+        """Aplica el lote y sus eventos en una transaccion; el lock del proceso serializa la verificacion."""
+        rechazos, eventos, ts = {}, [], _marca_evento()
+        with self._lock, self._conn:
+            for t in tomas:
+                actual = self._conn.execute(
+                    "SELECT def_tomadas, int_tomadas FROM plazas WHERE zona = ? AND especialidad = ?",
+                    (t.zona, t.especialidad),
+                ).fetchone()
+                motivo = t.conflicto(*actual) if actual else f"No existe la plaza {t.zona} / {t.especialidad}"
+                if motivo:
+                    rechazos[t.clave] = motivo
+                    continue
+                self._conn.execute(
+                    "UPDATE plazas SET def_tomadas = ?, int_tomadas = ? WHERE zona = ? AND especialidad = ?",
+                    (int(t.def_tomadas), int(t.int_tomadas), t.zona, t.especialidad),
+                )
+                eventos += t.eventos(*actual, ts)
+            if eventos:
+                self._conn.executemany(
+                    f"INSERT INTO eventos ({', '.join(COLUMNAS_EVENTO)}) VALUES ({', '.join('?' * len(COLUMNAS_EVENTO))})",
+                    eventos,
+                )
+            if len(rechazos) < len(tomas):
+                self._registrar_guardado()
+        return rechazos
+
+    def leer_eventos(self, desde=0):
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT id, {', '.join(COLUMNAS_EVENTO)} FROM eventos WHERE id > ? ORDER BY id", (desde,)
+            ).fetchall()
+        return [list(f[1:]) for f in filas], (filas[-1][0] if filas else desde)
+
+    def fijar_dia(self, dia, indice=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO config VALUES ('dia_evento', ?)", (str(int(dia)),))
+
+
+def control_desde(opciones):
+    """ControlLlamadas con los limites de `opciones`; por defecto la cuota por usuario de la API de Sheets."""
+    return ControlLlamadas(
+        lecturas_por_minuto=int(opciones.get("sheets_lecturas_min", 60)),
+        escrituras_por_minuto=int(opciones.get("sheets_escrituras_min", 60)),
+        reintentos=int(opciones.get("sheets_reintentos", 4)),
+        fallos_para_abrir=int(opciones.get("sheets_fallos_circuito", 5)),
+        enfriamiento=float(opciones.get("sheets_enfriamiento_s", 30)),
+    )
+
+
+def crear_backend(opciones):
+    """Construye el backend indicado en `opciones` (normalmente st.secrets)."""
+    tipo = opciones.get("backend", "sheets")
+    if tipo == "sqlite":
+        return BackendSQLite(opciones.get("sqlite_ruta", "draft_imss.db"), opciones.get("sqlite_semilla"))
+    if tipo == "fake":
+        libro = libro_simulado(
+            opciones.get("fake_id", "default"),
+            filas=int(opciones.get("fake_filas", 200)),
+            latencia=float(opciones.get("fake_latencia_ms", 0)) / 1000,
+            tasa_fallos=float(opciones.get("fake_tasa_fallos", 0)),
+        )
+        return BackendSheets(ConexionSimulada(libro, control_desde(opciones)))
+    if tipo != "sheets":
+        raise ValueError(f"Backend desconocido: {tipo!r} (usa 'sheets', 'sqlite' o 'fake')")
+    return BackendSheets(ConexionSheets(dict(opciones["gcp_service_account"]), opciones["spreadsheet_id"],
+                                        control_desde(opciones)))
+
+
+def delegaciones_desde(opciones, predeterminada):
+    """Lista de (nombre, opciones) de cada delegacion a monitorear.
+
+    Sin la lista `delegaciones` hay una sola (`delegacion` o `predeterminada`)
+    con las opciones generales. Cada entrada de la lista lleva su `nombre` y
+    hereda las opciones generales, sobrescribiendo las suyas: spreadsheet_id,
+    backend, sqlite_ruta, fake_id...
+    """
+    lista = opciones.get("delegaciones")
+    if not lista:
+        return [(opciones.get("delegacion", predeterminada), opciones)]
+    generales = {clave: valor for clave, valor in opciones.items() if clave != "delegaciones"}
+    fuentes = []
+    for entrada in lista:
+        entrada = dict(entrada)
+        nombre = str(entrada.pop("nombre", "")).strip()
+        if not nombre:
+            raise ValueError("Cada entrada de 'delegaciones' necesita un nombre")
+        fuentes.append((nombre, {**generales, **entrada}))
+    repetidos = [n for n, k in Counter(n for n, _ in fuentes).items() if k > 1]
+    if repetidos:
+        raise ValueError("Delegaciones repetidas: " + ", ".join(repetidos))
+    return fuentes
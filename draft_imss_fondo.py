@@ -0,0 +1,459 @@
+"""
+DRAFT IMSS 2026 - Hilos de fondo
+Refresco del snapshot, cola de escrituras y publicacion estatica
+
+Cada objeto vive una vez por proceso (st.cache_resource en la app) y lo
+comparten todas las sesiones. Las metricas y el contenido a publicar los
+recibe de la app al crearse: este modulo no depende de Streamlit.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+from draft_imss_datos import ErrorTransitorio, escribir_atomico, eventos_a_df, guardar_copia, leer_copia, version_datos
+from draft_imss_snapshot import (
+    DELEGACION, NACIONAL, acumular_eventos, aplicar_eventos, combinar_snapshots, construir_snapshot, derivar_snapshot,
+)
+
+# Cada cuantos segundos el refrescador consulta el marcador de version en Config
+REFRESCO_INTERVALO = 5
+# Espera maxima del primer arranque antes de mostrar error
+ESPERA_PRIMER_SNAPSHOT = 60
+# Con varias delegaciones, cuanto mas se espera a las que faltan una vez que alguna ya cargo
+DELEGACIONES_ESPERA = 5
+# Lecturas simultaneas al backend entre todas las delegaciones (st.secrets["delegaciones_hilos"])
+DELEGACIONES_HILOS = 8
+# Recarga de seguridad de Plazas aunque el marcador no cambie (ediciones a mano)
+PLAZAS_TTL = 600
+
+# Ventana en la que la cola de escrituras junta guardados en un mismo lote
+COLA_VENTANA = 0.25
+# Pausa antes de reenviar un lote que no se pudo guardar porque Sheets no respondia
+COLA_REINTENTO = 5
+
+
+# -----------------------------------------------
+# SNAPSHOT AL DIA (una o varias delegaciones)
+# -----------------------------------------------
+
+class RefrescadorSnapshot:
+    """Hilo de fondo que mantiene el snapshot al dia (stale-while-revalidate).
+
+    Cada REFRESCO_INTERVALO segundos lee el marcador de Config. Si la version
+    cambio, lee solo los eventos nuevos de la bitacora y los aplica al snapshot;
+    Plazas completa se descarga al arrancar, cuando un evento no cuadra con el
+    snapshot o al vencer PLAZAS_TTL. El snapshot nuevo se publica con una sola
+    asignacion, asi los reruns nunca esperan a la red.
+
+    Con `ruta_copia`, cada snapshot nuevo se guarda en disco y al arrancar se
+    sirve la ultima copia de inmediato mientras llega la primera lectura; si el
+    backend no responde, la copia se sigue mostrando con su antiguedad.
+
+    Con `ejecutor` (el pool que comparten las delegaciones) las lecturas al
+    backend corren en ese pool; el ciclo y su intervalo siguen siendo propios.
+    """
+
+    def __init__(self, backend, metricas, publicador=None, ruta_copia=None, delegacion=DELEGACION, ejecutor=None):
+        self.backend = backend
+        self.metricas = metricas
+        self.publicador = publicador
+        self.ruta_copia = ruta_copia
+        self.delegacion = delegacion
+        self.ejecutor = ejecutor
+        self.ultimo_error = None
+        self.verificado_en = None
+        self.snapshot = self._leer_copia() if ruta_copia else None
+        self._generacion = 0
+        self._cond = threading.Condition()
+        self._despertar = threading.Event()
+        self._hilo = threading.Thread(target=self._ciclo, name=f"refrescador-{delegacion}", daemon=True)
+        self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            previo = self.snapshot
+            try:
+                if self.ejecutor is None:
+                    self._refrescar()
+                else:
+                    self.ejecutor.submit(self._refrescar).result()
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = e
+            if self.snapshot is not previo:
+                if self.ruta_copia:
+                    self._guardar_copia(self.snapshot)
+                if self.publicador is not None:
+                    self.publicador.solicitar(self.snapshot)
+            with self._cond:
+                self._generacion += 1
+                self._cond.notify_all()
+            self._despertar.wait(REFRESCO_INTERVALO)
+            self._despertar.clear()
+
+    def _refrescar(self):
+        actual = self.snapshot
+        vencido = actual is None or time.time() - actual.tabla_leida_en > PLAZAS_TTL
+        if not vencido:
+            config, config_filas = self.backend.leer_config()
+            version = version_datos(config)
+            if actual.version == version:
+                if actual.config != config:
+                    self.snapshot = replace(actual, config=config, indice={**actual.indice, "config": config_filas})
+                self.verificado_en = time.time()
+                return
+            leido_en = time.time()
+            filas, cursor = self.backend.leer_eventos(actual.cursor_eventos)
+            # Version nueva sin eventos (una edicion a mano, o un guardado de otro
+            # proceso a medias): solo la tabla dice que cambio
+            df = aplicar_eventos(actual, eventos_a_df(filas)) if filas else None
+            if df is not None:
+                self.snapshot = derivar_snapshot(
+                    actual, df, leido_en, config=config, indice={**actual.indice, "config": config_filas},
+                    version=version, eventos=acumular_eventos(actual.eventos, filas), cursor_eventos=cursor,
+                )
+                self.verificado_en = time.time()
+                return
+
+        # Lectura completa: Plazas y Config en una sola solicitud.
+        # Cursor antes que la tabla: los eventos previos ya estan en Plazas y los que
+        # lleguen entre ambas lecturas se reaplican (sin efecto) en el siguiente ciclo
+        leido_en = time.time()
+        filas, cursor = self.backend.leer_eventos(actual.cursor_eventos if actual else 0)
+        config, config_filas, df, indice = self.backend.cargar_completo()
+        eventos = acumular_eventos(actual.eventos if actual else None, filas)
+        indice = {**indice, "config": config_filas}
+        if actual is None:
+            self.snapshot = construir_snapshot(df, config, indice, version_datos(config), leido_en, eventos, cursor,
+                                               self.delegacion)
+        else:
+            # Contra el snapshot anterior (o la copia en disco): solo se recalculan las plazas que cambiaron
+            self.snapshot = derivar_snapshot(actual, df, leido_en, config=config, indice=indice,
+                                             version=version_datos(config), eventos=eventos, cursor_eventos=cursor,
+                                             tabla_leida_en=leido_en)
+        self.verificado_en = time.time()
+
+    def _leer_copia(self):
+        """Snapshot de la copia en disco, o None si no hay una utilizable para este backend."""
+        leido = leer_copia(self.ruta_copia)
+        if leido is None or leido[1].get("origen") != self.backend.origen:
+            return None
+        df, cabecera = leido
+        snapshot = construir_snapshot(df, cabecera["config"], None, cabecera["version"],
+                                      cabecera["plazas_cargadas_en"], eventos_a_df([]), 0, self.delegacion)
+        # tabla_leida_en = 0 vence la copia: el primer ciclo relee Plazas y la bitacora completa
+        return replace(snapshot, tabla_leida_en=0, copia_local=True)
+
+    def _guardar_copia(self, snapshot):
+        try:
+            with self.metricas.tramo("copia_local"):
+                guardar_copia(self.ruta_copia, snapshot.df, {
+                    "origen": self.backend.origen,
+                    "version": snapshot.version,
+                    "config": snapshot.config,
+                    "plazas_cargadas_en": snapshot.plazas_cargadas_en,
+                })
+        except Exception:
+            # El snapshot en memoria sigue valido; el tramo ya conto el fallo en copia_local.errores
+            pass
+
+    def edad(self):
+        """Segundos desde la ultima verificacion exitosa contra el backend."""
+        return None if self.verificado_en is None else time.time() - self.verificado_en
+
+    def solicitar(self, esperar=0):
+        """Pide un refresco inmediato; opcionalmente espera hasta `esperar` segundos a que termine."""
+        with self._cond:
+            objetivo = self._generacion + 2 if esperar else None
+            self._despertar.set()
+            if esperar:
+                self._cond.wait_for(lambda: self._generacion >= objetivo, timeout=esperar)
+
+    def snapshot_actual(self):
+        """Retorna el snapshot vigente; solo bloquea en el arranque, antes de la primera carga."""
+        if self.snapshot is None:
+            with self._cond:
+                self._cond.wait_for(lambda: self.snapshot is not None or self.ultimo_error is not None,
+                                    timeout=ESPERA_PRIMER_SNAPSHOT)
+        if self.snapshot is None:
+            raise self.ultimo_error or TimeoutError(f"Sin respuesta de {self.backend.nombre}")
+        return self.snapshot
+
+
+class GrupoDelegaciones:
+    """Refrescadores de las delegaciones configuradas y el snapshot nacional que las suma.
+
+    Cada delegacion tiene su refrescador (ciclo, copia en disco y estado de
+    error propios) y sus lecturas pasan por un pool de `hilos` hilos: una hoja
+    lenta o caida ocupa un hilo sin frenar a las demas. El grupo hace de
+    publicador de cada refrescador; cuando una delegacion publica un snapshot
+    se arma de nuevo el nacional, que es el que recibe el publicador estatico.
+    Con una sola delegacion, el nacional es el snapshot de esa delegacion.
+    """
+
+    def __init__(self, fuentes, metricas, publicador=None, hilos=DELEGACIONES_HILOS):
+        self.metricas = metricas
+        self.publicador = publicador
+        self.nacional = None
+        self._cond = threading.Condition()
+        self._pendiente = self._combinando = False
+        self._ejecutor = None
+        if len(fuentes) > 1:
+            self._ejecutor = ThreadPoolExecutor(max_workers=max(1, min(len(fuentes), hilos)),
+                                                thread_name_prefix="delegacion")
+        # Bajo el lock: un refrescador que termina antes de armar el diccionario espera para avisar
+        with self._cond:
+            self.refrescadores = {
+                nombre: RefrescadorSnapshot(backend, metricas, self, ruta_copia, nombre, self._ejecutor)
+                for nombre, backend, ruta_copia in fuentes
+            }
+            self.nacional = self._combinar()
+
+    @property
+    def varias(self):
+        return len(self.refrescadores) > 1
+
+    def solicitar(self, snapshot):
+        """Aviso de un refrescador con un snapshot nuevo de su delegacion.
+
+        Si otro hilo ya esta armando el nacional solo lo deja pendiente y sigue
+        su ciclo; ese hilo lo vuelve a armar al terminar, asi una rafaga de
+        avisos (p. ej. todas las delegaciones al arrancar) se combina pocas veces.
+        """
+        with self._cond:
+            self._pendiente = True
+            if self._combinando:
+                return
+            self._combinando = True
+        while True:
+            with self._cond:
+                if not self._pendiente:
+                    self._combinando = False
+                    return
+                self._pendiente = False
+            nacional = self._combinar()
+            with self._cond:
+                self.nacional = nacional
+                self._cond.notify_all()
+            if self.publicador is not None and nacional is not None:
+                self.publicador.solicitar(nacional)
+
+    def _combinar(self):
+        particiones = {nombre: r.snapshot for nombre, r in self.refrescadores.items() if r.snapshot is not None}
+        if not particiones:
+            return None
+        if not self.varias:
+            return next(iter(particiones.values()))
+        with self.metricas.tramo("nacional"):
+            return combinar_snapshots(particiones, self.nacional)
+
+    def pendientes(self):
+        """Delegaciones sin datos al dia: {nombre: (tiene datos, ultimo error)}."""
+        return {nombre: (r.snapshot is not None, r.ultimo_error) for nombre, r in self.refrescadores.items()
+                if r.snapshot is None or r.snapshot.copia_local or r.ultimo_error is not None}
+
+    def snapshot_actual(self, vista=NACIONAL):
+        """Snapshot de una delegacion o el nacional; solo bloquea en el arranque.
+
+        El nacional espera a que cada delegacion cargue o falle, pero una vez
+        que alguna tiene datos no mas de DELEGACIONES_ESPERA segundos: las que
+        tarden se suman en cuanto lleguen.
+        """
+        if vista in self.refrescadores:
+            return self.refrescadores[vista].snapshot_actual()
+        if not self.varias:
+            return next(iter(self.refrescadores.values())).snapshot_actual()
+        inicio = time.time()
+        with self._cond:
+            while any(r.snapshot is None and r.ultimo_error is None for r in self.refrescadores.values()):
+                espera = ESPERA_PRIMER_SNAPSHOT if self.nacional is None else DELEGACIONES_ESPERA
+                restante = inicio + espera - time.time()
+                if restante <= 0:
+                    break
+                # Los errores no avisan: se revisa cada poco
+                self._cond.wait(min(restante, 0.25))
+        if self.nacional is None:
+            errores = [r.ultimo_error for r in self.refrescadores.values() if r.ultimo_error is not None]
+            raise errores[0] if errores else TimeoutError("Sin respuesta de ninguna delegacion")
+        return self.nacional
+
+    def vigente(self, vista):
+        """Ultimo snapshot publicado de la vista, sin esperar."""
+        return self.refrescadores[vista].snapshot if vista in self.refrescadores else self.nacional
+
+
+# -----------------------------------------------
+# COLA DE ESCRITURAS (panel Normativo)
+# -----------------------------------------------
+
+class TicketGuardado:
+    """Acuse de un guardado encolado; el hilo de la cola lo resuelve al enviar el lote."""
+
+    def __init__(self, toma, delegacion=DELEGACION):
+        self.toma = toma
+        self.delegacion = delegacion
+        self.estado = "pendiente"
+        self.mensaje = ""
+        self.resuelto_en = None
+        # La sesion lo marca al recargar la pagina con el guardado ya en el snapshot
+        self.mostrado = False
+
+    def resolver(self, estado, mensaje=""):
+        self.estado, self.mensaje, self.resuelto_en = estado, mensaje, time.time()
+
+
+class ColaEscrituras:
+    """Cola write-behind de guardados del panel Normativo, una por delegacion y proceso.
+
+    Los guardados que llegan dentro de COLA_VENTANA se juntan en un solo lote
+    (una verificacion y una escritura en el backend). Dos guardados de la misma
+    plaza se fusionan conservando el valor esperado del primero, y el backend
+    rechaza los que ya no coinciden con el dato guardado (concurrencia optimista).
+    """
+
+    def __init__(self, backend, refrescador):
+        self.backend = backend
+        self.refrescador = refrescador
+        self._pendientes = {}
+        self._confirmados = {}
+        self._cond = threading.Condition()
+        self._hilo = threading.Thread(target=self._ciclo, name="cola-escrituras", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, toma):
+        """Agrega un guardado y retorna su ticket de inmediato, sin esperar al backend."""
+        return self.encolar_lote([toma])[0]
+
+    def encolar_lote(self, tomas):
+        """Agrega varios guardados de una vez; retorna sus tickets.
+
+        Entran a la cola bajo un mismo lock, asi que viajan en el mismo lote:
+        una lectura, una escritura y un solo registro de guardado en Config.
+        """
+        tickets = []
+        with self._cond:
+            for toma in tomas:
+                ticket = TicketGuardado(toma, self.refrescador.delegacion)
+                if toma.clave in self._pendientes:
+                    previa, anteriores = self._pendientes[toma.clave]
+                    toma = replace(toma, esperado_def=previa.esperado_def, esperado_int=previa.esperado_int)
+                    self._pendientes[toma.clave] = (toma, anteriores + [ticket])
+                else:
+                    self._pendientes[toma.clave] = (toma, [ticket])
+                tickets.append(ticket)
+            self._cond.notify()
+        return tickets
+
+    def valores(self, zona, especialidad, snapshot, fila):
+        """Plazas tomadas vigentes (optimistas): pendiente en cola, confirmado reciente o snapshot."""
+        with self._cond:
+            if (zona, especialidad) in self._pendientes:
+                toma = self._pendientes[(zona, especialidad)][0]
+                return toma.def_tomadas, toma.int_tomadas
+            confirmado = self._confirmados.get((zona, especialidad))
+        if confirmado and confirmado[2] > snapshot.plazas_cargadas_en:
+            return confirmado[0], confirmado[1]
+        return int(fila["def_tomadas"]), int(fila["int_tomadas"])
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pendientes)
+            time.sleep(COLA_VENTANA)
+            with self._cond:
+                lote, self._pendientes = self._pendientes, {}
+            self._enviar(lote)
+
+    def _enviar(self, lote):
+        snapshot = self.refrescador.snapshot
+        try:
+            rechazos = self.backend.aplicar_tomas([toma for toma, _ in lote.values()],
+                                                  snapshot.indice if snapshot else None)
+        except ErrorTransitorio as e:
+            # El lote vuelve a la cola y se reintenta cuando Sheets responda. Si alcanzo a
+            # guardarse en parte, el backend lo reconoce (valor ya escrito, eventos por id de Toma)
+            self._reencolar(lote, str(e))
+            time.sleep(COLA_REINTENTO)
+            return
+        except Exception as e:
+            for _, tickets in lote.values():
+                for ticket in tickets:
+                    ticket.resolver("error", str(e))
+            return
+
+        guardado_en = time.time()
+        with self._cond:
+            for clave, (toma, tickets) in lote.items():
+                if clave in rechazos:
+                    estado, mensaje = "rechazado", rechazos[clave]
+                else:
+                    estado, mensaje = "guardado", ""
+                    self._confirmados[clave] = (toma.def_tomadas, toma.int_tomadas, guardado_en)
+                for ticket in tickets:
+                    ticket.resolver(estado, mensaje)
+        self.refrescador.solicitar()
+
+    def _reencolar(self, lote, motivo):
+        """Devuelve un lote a la cola; si la plaza se volvio a guardar, gana el valor nuevo."""
+        with self._cond:
+            for clave, (toma, tickets) in lote.items():
+                for ticket in tickets:
+                    ticket.mensaje = motivo
+                if clave in self._pendientes:
+                    nueva, nuevos = self._pendientes[clave]
+                    nueva = replace(nueva, esperado_def=toma.esperado_def, esperado_int=toma.esperado_int)
+                    self._pendientes[clave] = (nueva, tickets + nuevos)
+                else:
+                    self._pendientes[clave] = (toma, tickets)
+
+
+# -----------------------------------------------
+# VISTA PUBLICA ESTATICA
+# -----------------------------------------------
+
+class PublicadorEstatico:
+    """Hilo que escribe la vista publica estatica cada vez que el refrescador publica un snapshot.
+
+    En `directorio` deja index.html, plazas.json y plazas.csv, listos para un
+    servidor de archivos o proxy inverso: los candidatos que solo consultan no
+    abren sesiones de Streamlit. Si llegan varios snapshots mientras escribe,
+    solo se publica el mas reciente.
+
+    `archivos(snapshot)` da los pares (nombre, bytes) en el orden en que se
+    escriben; la app arma el contenido (HTML, JSON, CSV).
+    """
+
+    def __init__(self, directorio, metricas, archivos):
+        self.directorio = Path(directorio)
+        self.metricas = metricas
+        self.archivos = archivos
+        self.version_publicada = None
+        self.ultimo_error = None
+        self._pendiente = None
+        self._cond = threading.Condition()
+        self._hilo = threading.Thread(target=self._ciclo, name="publicador-estatico", daemon=True)
+        self._hilo.start()
+
+    def solicitar(self, snapshot):
+        with self._cond:
+            self._pendiente = snapshot
+            self._cond.notify()
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pendiente is not None)
+                snapshot, self._pendiente = self._pendiente, None
+            try:
+                with self.metricas.tramo("publicacion"):
+                    self.publicar(snapshot)
+                self.version_publicada, self.ultimo_error = snapshot.version, None
+            except Exception as e:
+                self.ultimo_error = e
+
+    def publicar(self, snapshot):
+        for nombre, contenido in self.archivos(snapshot):
+            escribir_atomico(self.directorio / nombre, contenido)
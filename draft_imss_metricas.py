@@ -0,0 +1,210 @@
+"""
+DRAFT IMSS 2026 - Metricas del proceso
+Tramos de tiempo, histogramas y contadores para diagnostico
+
+Un objeto Metricas vive una vez por proceso (st.cache_resource en la app) y lo
+comparten todas las sesiones y los hilos de fondo. Se exporta en formato de
+texto de Prometheus o como JSON. Deshabilitado, cada medicion es una llamada
+que no hace nada.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+
+# Limites superiores (segundos) de las cubetas de los histogramas
+CUBETAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIJO = "draft_imss"
+
+_NULO = nullcontext()
+
+
+class Histograma:
+    """Conteo por cubetas fijas, suma y maximo; los percentiles se estiman por interpolacion."""
+
+    def __init__(self):
+        self.cubetas = [0] * (len(CUBETAS) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+        self.maximo = 0.0
+
+    def observar(self, segundos):
+        self.cubetas[bisect_left(CUBETAS, segundos)] += 1
+        self.suma += segundos
+        self.cuenta += 1
+        self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, p):
+        if not self.cuenta:
+            return None
+        objetivo = p / 100 * self.cuenta
+        acumulado = 0
+        for i, n in enumerate(self.cubetas):
+            if n and acumulado + n >= objetivo:
+                inferior = CUBETAS[i - 1] if i else 0.0
+                superior = CUBETAS[i] if i < len(CUBETAS) else self.maximo
+                return min(self.maximo, inferior + (superior - inferior) * (objetivo - acumulado) / n)
+            acumulado += n
+        return self.maximo
+
+    def resumen(self):
+        return {
+            "cuenta": self.cuenta,
+            "suma_s": round(self.suma, 6),
+            "p50_ms": _ms(self.percentil(50)),
+            "p95_ms": _ms(self.percentil(95)),
+            "p99_ms": _ms(self.percentil(99)),
+            "max_ms": _ms(self.maximo),
+        }
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+class _Tramo:
+    __slots__ = ("metricas", "nombre", "inicio")
+
+    def __init__(self, metricas, nombre):
+        self.metricas = metricas
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, *_):
+        self.metricas.observar(self.nombre, time.perf_counter() - self.inicio)
+        if tipo is not None:
+            self.metricas.contar(f"{self.nombre}.errores")
+        return False
+
+
+class Cronometro:
+    """Vueltas consecutivas de un rerun: cada vuelta mide desde la marca anterior."""
+
+    def __init__(self, metricas, inicio):
+        self.metricas = metricas
+        self.inicio = self._marca = inicio
+
+    def vuelta(self, nombre):
+        ahora = time.perf_counter()
+        self.metricas.observar(f"seccion.{nombre}", ahora - self._marca)
+        self._marca = ahora
+
+    def total(self, nombre="rerun"):
+        """Registra la duracion completa desde el inicio; retorna los segundos."""
+        segundos = time.perf_counter() - self.inicio
+        self.metricas.observar(nombre, segundos)
+        return segundos
+
+
+class _CronometroNulo:
+    def vuelta(self, nombre):
+        pass
+
+    def total(self, nombre="rerun"):
+        return None
+
+
+class Metricas:
+    """Histogramas de duracion y contadores del proceso, seguros entre hilos."""
+
+    def __init__(self, habilitado=True):
+        self.habilitado = habilitado
+        self.desde = time.time()
+        self.valores = {}
+        self.histogramas = {}
+        self.contadores = Counter()
+        self._lock = threading.Lock()
+
+    def tramo(self, nombre):
+        """Context manager que mide el bloque como observacion del histograma `nombre`."""
+        return _Tramo(self, nombre) if self.habilitado else _NULO
+
+    def cronometro(self, inicio):
+        return Cronometro(self, inicio) if self.habilitado else _CronometroNulo()
+
+    def observar(self, nombre, segundos):
+        if not self.habilitado:
+            return
+        with self._lock:
+            if nombre not in self.histogramas:
+                self.histogramas[nombre] = Histograma()
+            self.histogramas[nombre].observar(segundos)
+
+    def contar(self, nombre, n=1):
+        if self.habilitado:
+            with self._lock:
+                self.contadores[nombre] += n
+
+    def fijar(self, nombre, valor):
+        """Valor puntual (gauge), p. ej. el arranque en frio."""
+        if self.habilitado:
+            with self._lock:
+                self.valores[nombre] = valor
+
+    def resumen(self, extra=None):
+        """Diccionario serializable con todo lo medido; `extra` agrega metricas externas (p. ej. del backend)."""
+        with self._lock:
+            datos = {
+                "desde": self.desde,
+                "valores": dict(self.valores),
+                "histogramas": {n: h.resumen() for n, h in sorted(self.histogramas.items())},
+                "contadores": dict(sorted(self.contadores.items())),
+            }
+        if extra:
+            datos["backend"] = extra
+        return datos
+
+    def json(self, extra=None):
+        return json.dumps(self.resumen(extra), ensure_ascii=False, indent=2)
+
+    def prometheus(self, extra=None):
+        """Exposicion en formato de texto de Prometheus."""
+        lineas = []
+        with self._lock:
+            lineas.append(f"# TYPE {PREFIJO}_duracion_segundos histogram")
+            for nombre, h in sorted(self.histogramas.items()):
+                acumulado = 0
+                for limite, n in zip(CUBETAS + ("+Inf",), h.cubetas):
+                    acumulado += n
+                    lineas.append(f'{PREFIJO}_duracion_segundos_bucket{{tramo="{nombre}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{PREFIJO}_duracion_segundos_sum{{tramo="{nombre}"}} {h.suma:.6f}')
+                lineas.append(f'{PREFIJO}_duracion_segundos_count{{tramo="{nombre}"}} {h.cuenta}')
+            lineas.append(f"# TYPE {PREFIJO}_eventos_total counter")
+            for nombre, n in sorted(self.contadores.items()):
+                lineas.append(f'{PREFIJO}_eventos_total{{evento="{nombre}"}} {n}')
+            lineas.append(f"# TYPE {PREFIJO}_valor gauge")
+            for nombre, valor in sorted(self.valores.items()):
+                lineas.append(f'{PREFIJO}_valor{{nombre="{nombre}"}} {valor}')
+        for nombre, valor in sorted((extra or {}).items()):
+            if isinstance(valor, (int, float)):
+                lineas.append(f'{PREFIJO}_backend{{metrica="{nombre}"}} {valor}')
+            else:
+                lineas.append(f'{PREFIJO}_backend_info{{metrica="{nombre}",valor="{valor}"}} 1')
+        return "\n".join(lineas) + "\n"
+
+
+class BackendMedido:
+    """Envuelve un backend de draft_imss_datos midiendo cada operacion como tramo `backend.<metodo>`."""
+
+    OPERACIONES = ("leer_config", "cargar_plazas", "cargar_completo", "leer_eventos", "aplicar_tomas", "fijar_dia")
+
+    def __init__(self, backend, metricas):
+        self._backend = backend
+        self._metricas = metricas
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._backend, nombre)
+        if nombre not in self.OPERACIONES or not self._metricas.habilitado:
+            return atributo
+
+        def medido(*args, **kwargs):
+            with self._metricas.tramo(f"backend.{nombre}"):
+                return atributo(*args, **kwargs)
+        return medido
@@ -0,0 +1,497 @@
+"""
+DRAFT IMSS 2026 - Snapshot de plazas
+Datos en memoria que comparten todas las sesiones y como se derivan
+
+Un Snapshot no se modifica: cada lectura de la tabla o de la bitacora arma uno
+nuevo (construir_snapshot, derivar_snapshot, combinar_snapshots) que se publica
+con una sola asignacion. Lo usan la app y los hilos de fondo
+(draft_imss_fondo.py); no depende de Streamlit.
+"""
+
+import hashlib
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from functools import lru_cache, reduce
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+from draft_imss_datos import eventos_a_df
+
+# Similitud minima (Dice de trigramas) para aceptar una palabra con error de dedo
+BUSQUEDA_SIMILITUD_MIN = 0.5
+# Combinaciones de filtros de Plazas cuyas filas se recuerdan por snapshot
+FILTROS_MEMO = 64
+# Delegacion cuando no hay lista st.secrets["delegaciones"], y nombre de la vista que las suma
+DELEGACION = "OOAD Baja California"
+NACIONAL = "Nacional"
+# Ultimos cambios de plazas que guarda cada snapshot
+CAMBIOS_MAX = 200
+
+
+@dataclass(frozen=True)
+class Agregados:
+    """Tablas resumen de un snapshot, calculadas una sola vez por version de datos."""
+    kpis: dict
+    por_zona: pd.DataFrame
+    por_especialidad: pd.DataFrame
+    disp_por_zona: dict
+    zonas_por_especialidad: dict
+    especialidades_por_zona: dict
+    posicion: dict
+
+
+def calcular_agregados(df):
+    """Agrupa una sola vez lo que las pestañas antes filtraban con una mascara por zona/especialidad."""
+    # Las sumas se hacen en int64: los conteos del snapshot son int16 y un total nacional podria desbordarlos
+    conteos = df[["def_total", "int_total", "def_tomadas", "int_tomadas", "total_disp"]].astype("int64")
+    base = df.assign(
+        tomadas=conteos["def_tomadas"] + conteos["int_tomadas"],
+        totales=conteos["def_total"] + conteos["int_total"],
+        total_disp=conteos["total_disp"],
+        con_disp=df["total_disp"] > 0,
+    )
+    por_zona = base.groupby("zona", sort=True, observed=True).agg(
+        disp=("total_disp", "sum"), tom=("tomadas", "sum"), tot=("totales", "sum"), n_disp=("con_disp", "sum"),
+    )
+    por_especialidad = base.groupby("especialidad", sort=True, observed=True).agg(
+        disp=("total_disp", "sum"), zonas_con=("con_disp", "sum"), total_zonas=("zona", "size"),
+    )
+    # Zonas de cada especialidad, primero las que tienen disponibles
+    ordenado = df.sort_values("total_disp", ascending=False, kind="stable")
+    return Agregados(
+        kpis={
+            "total": int(base["totales"].sum()),
+            "disp": int(df["total_disp"].sum()),
+            "def_d": int(df["def_disp"].sum()),
+            "int_d": int(df["int_disp"].sum()),
+        },
+        por_zona=por_zona,
+        por_especialidad=por_especialidad,
+        disp_por_zona={z: g for z, g in df[base["con_disp"]].groupby("zona", sort=False, observed=True)},
+        zonas_por_especialidad={e: g for e, g in ordenado.groupby("especialidad", sort=False, observed=True)},
+        especialidades_por_zona={z: sorted(g.unique()) for z, g in df.groupby("zona", sort=False, observed=True)["especialidad"]},
+        posicion={k: i for i, k in enumerate(zip(df["zona"], df["especialidad"]))},
+    )
+
+
+def _contribuciones(parte):
+    """Aporte de cada fila a los agregados numericos (int64)."""
+    conteos = parte[["def_total", "int_total", "def_tomadas", "int_tomadas", "def_disp", "int_disp",
+                     "total_disp"]].astype("int64")
+    return pd.DataFrame({
+        "disp": conteos["total_disp"],
+        "tom": conteos["def_tomadas"] + conteos["int_tomadas"],
+        "tot": conteos["def_total"] + conteos["int_total"],
+        "con_disp": (conteos["total_disp"] > 0).astype("int64"),
+        "def_d": conteos["def_disp"],
+        "int_d": conteos["int_disp"],
+    }, index=parte.index)
+
+
+def actualizar_agregados(ag, viejo, nuevo, filas):
+    """Agregados tras cambiar los conteos de `filas` (posiciones; mismas plazas en el mismo
+    orden): se ajustan sumas con la diferencia de esas filas y solo se rearman las
+    zonas/especialidades tocadas.
+    """
+    antes, despues = viejo.iloc[filas], nuevo.iloc[filas]
+    dif = _contribuciones(despues) - _contribuciones(antes)
+    zona, especialidad = despues["zona"].astype(str), despues["especialidad"].astype(str)
+
+    kpis = {"total": ag.kpis["total"] + int(dif["tot"].sum()), "disp": ag.kpis["disp"] + int(dif["disp"].sum()),
+            "def_d": ag.kpis["def_d"] + int(dif["def_d"].sum()), "int_d": ag.kpis["int_d"] + int(dif["int_d"].sum())}
+
+    por_zona = ag.por_zona.copy()
+    dz = dif.groupby(zona)[["disp", "tom", "tot", "con_disp"]].sum()
+    por_zona.loc[dz.index, ["disp", "tom", "tot", "n_disp"]] += dz.to_numpy()
+    por_especialidad = ag.por_especialidad.copy()
+    de = dif.groupby(especialidad)[["disp", "con_disp"]].sum()
+    por_especialidad.loc[de.index, ["disp", "zonas_con"]] += de.to_numpy()
+
+    disp_por_zona = dict(ag.disp_por_zona)
+    for z in dz.index:
+        parte = nuevo.iloc[sorted(ag.posicion[(z, e)] for e in ag.especialidades_por_zona[z])]
+        parte = parte[parte["total_disp"] > 0]
+        if parte.empty:
+            disp_por_zona.pop(z, None)
+        else:
+            disp_por_zona[z] = parte
+    zonas_por_especialidad = dict(ag.zonas_por_especialidad)
+    for e in de.index:
+        parte = nuevo.iloc[sorted(ag.zonas_por_especialidad[e].index)]
+        zonas_por_especialidad[e] = parte.sort_values("total_disp", ascending=False, kind="stable")
+
+    return replace(ag, kpis=kpis, por_zona=por_zona, por_especialidad=por_especialidad,
+                   disp_por_zona=disp_por_zona, zonas_por_especialidad=zonas_por_especialidad)
+
+
+def normalizar(texto):
+    """Minusculas, sin acentos y con la puntuacion convertida en espacios: 'Pediatría' -> 'pediatria'."""
+    sin_acentos = "".join(c for c in unicodedata.normalize("NFKD", str(texto)) if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", sin_acentos.casefold()).split())
+
+
+def _trigramas(palabra):
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceBusqueda:
+    """Indice de nombres de especialidad para busqueda sin acentos y tolerante a errores.
+
+    Se construye una vez por version de datos. Cada palabra de la consulta debe
+    coincidir con alguna palabra del nombre por prefijo o, si tiene un error de
+    dedo, por similitud de trigramas; tambien se aceptan subcadenas como antes.
+    """
+
+    def __init__(self, nombres):
+        self.nombres = list(nombres)
+        self.normalizados = [normalizar(n) for n in self.nombres]
+        self._por_palabra = defaultdict(set)
+        self._prefijos = defaultdict(set)
+        self._trigramas_palabra = defaultdict(set)
+        self._trigramas_nombre = defaultdict(set)
+        for i, nombre in enumerate(self.normalizados):
+            for palabra in nombre.split():
+                self._por_palabra[palabra].add(i)
+            for tri in _trigramas(nombre):
+                self._trigramas_nombre[tri].add(i)
+        for palabra in self._por_palabra:
+            for n in range(1, len(palabra) + 1):
+                self._prefijos[palabra[:n]].add(palabra)
+            for tri in _trigramas(palabra):
+                self._trigramas_palabra[tri].add(palabra)
+        self.buscar = lru_cache(maxsize=512)(self._buscar)
+
+    def _similares(self, palabra):
+        """Palabras del indice parecidas a `palabra`, con su penalizacion (0 = prefijo exacto)."""
+        encontradas = {p: 0.0 for p in self._prefijos.get(palabra, ())}
+        if not encontradas and len(palabra) >= 3:
+            tris = _trigramas(palabra)
+            comunes = defaultdict(int)
+            for tri in tris:
+                for p in self._trigramas_palabra.get(tri, ()):
+                    comunes[p] += 1
+            for p, n in comunes.items():
+                dice = 2 * n / (len(tris) + len(p) + 2)
+                if dice >= BUSQUEDA_SIMILITUD_MIN:
+                    encontradas[p] = 1 - dice
+        return encontradas
+
+    def _subcadena(self, consulta):
+        if len(consulta) < 3:
+            candidatos = range(len(self.nombres))
+        else:
+            internos = {consulta[i:i + 3] for i in range(len(consulta) - 2)}
+            conjuntos = sorted((self._trigramas_nombre.get(t, set()) for t in internos), key=len)
+            candidatos = conjuntos[0].intersection(*conjuntos[1:])
+        return {i for i in candidatos if consulta in self.normalizados[i]}
+
+    def _buscar(self, consulta):
+        consulta = normalizar(consulta)
+        if not consulta:
+            return list(self.nombres)
+
+        # Interseccion de conjuntos por palabra; la penalizacion solo se calcula para los sobrevivientes
+        ids, penas = None, []
+        for palabra in consulta.split():
+            similares = self._similares(palabra)
+            ids_palabra = set().union(*(self._por_palabra[p] for p in similares))
+            ids = ids_palabra if ids is None else ids & ids_palabra
+            if any(similares.values()):
+                penas.append(similares)
+        exactos = self._subcadena(consulta)
+
+        def relevancia(i):
+            nombre = self.normalizados[i]
+            nivel = 0 if nombre == consulta else 1 if nombre.startswith(consulta) else 2 if i in exactos else 3
+            pena = 0.0 if i in exactos else sum(
+                min(similares.get(p, 1.0) for p in nombre.split()) for similares in penas
+            )
+            return (nivel, pena, nombre)
+
+        return [self.nombres[i] for i in sorted(ids | exactos, key=relevancia)]
+
+
+class IndiceFiltros:
+    """Mapas de bits de las plazas para los filtros de la pestaña Plazas.
+
+    Se construye una vez por version de datos: un mapa por zona y uno por
+    estado (con disponibles, con definitivas, con interinas), empacados con
+    np.packbits. Una combinacion de filtros se resuelve con | y & sobre los
+    mapas, y sus filas quedan en un LRU que comparten todas las sesiones.
+    """
+
+    ESTADOS = {"disp": "total_disp", "def": "def_disp", "int": "int_disp"}
+
+    def __init__(self, df, zonas=None):
+        self.n = len(df)
+        if zonas is None:
+            codigos, valores = pd.factorize(df["zona"])
+            zonas = {str(z): np.packbits(codigos == i) for i, z in enumerate(valores)}
+        self.zonas = zonas
+        self.estados = {e: np.packbits(df[col].to_numpy() > 0) for e, col in self.ESTADOS.items()}
+        self._vacio = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        self._filas = lru_cache(maxsize=FILTROS_MEMO)(self._combinar)
+
+    def con_conteos(self, df):
+        """Indice para `df` con las mismas plazas en el mismo orden: conserva los mapas de zona."""
+        return IndiceFiltros(df, self.zonas)
+
+    def filas(self, zonas=(), estados=()):
+        """Posiciones (solo lectura) de las plazas en alguna de `zonas` (todas si no se indica)
+        y con todos los `estados` ("disp", "def", "int")."""
+        return self._filas(tuple(sorted(zonas)), tuple(sorted(estados)))
+
+    def _combinar(self, zonas, estados):
+        if zonas:
+            bits = reduce(np.bitwise_or, (self.zonas.get(z, self._vacio) for z in zonas))
+        else:
+            bits = np.full_like(self._vacio, 0xFF)
+        for e in estados:
+            bits = bits & self.estados[e]
+        # count=n descarta los bits de relleno del ultimo byte
+        filas = np.flatnonzero(np.unpackbits(bits, count=self.n))
+        filas.setflags(write=False)
+        return filas
+
+
+def texto_donde(cond, texto):
+    """Columna de texto: `texto` donde se cumple `cond`, vacio en el resto."""
+    return pd.Series(np.where(cond, texto, ""), index=cond.index)
+
+
+def html_tarjetas(vista):
+    """Tarjetas de especialidad construidas con operaciones de columna (sin iterrows)."""
+    tomadas = vista["def_tomadas"] + vista["int_tomadas"]
+    badges = (
+        texto_donde(vista["def_disp"] > 0, '<span class="badge badge-def">🎓 ' + vista["def_disp"].astype(str) + " Def.</span>")
+        + texto_donde(vista["int_disp"] > 0, '<span class="badge badge-int">📄 ' + vista["int_disp"].astype(str) + " Int.</span>")
+        + texto_donde(tomadas > 0, '<span class="badge badge-tom">❌ ' + tomadas.astype(str) + " tomadas</span>")
+    )
+    css = texto_donde(vista["total_disp"] > 0, "disponible") + texto_donde(vista["total_disp"] <= 0, "agotada")
+    return (
+        '<div class="esp-card ' + css + '">'
+        # Los nombres vienen de la hoja tal cual: se escapan (la pagina estatica no pasa por Streamlit)
+        + '<div class="esp-nombre">' + vista["especialidad"].astype(str).map(escape) + "</div>"
+        + '<div class="esp-zona">' + vista["zona"].astype(str).map(escape) + "</div>"
+        + '<div class="esp-badges">' + badges + "</div></div>"
+    )
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Foto inmutable de los datos, compartida por todas las sesiones.
+
+    `df` es el mismo objeto para todas (cache_resource, sin copias por sesion) y
+    se trata como solo lectura: las vistas se arman con mascaras e indices de
+    filas, y con copy-on-write de pandas ningun derivado puede modificarlo.
+
+    `plazas_cargadas_en` es hasta cuando llegan los datos (lectura de tabla o de
+    eventos); `tabla_leida_en`, la ultima lectura completa de Plazas.
+    `copia_local` marca el snapshot leido del disco al arrancar, que se muestra
+    mientras el backend responde.
+
+    `delegacion` es la fuente de los datos, o NACIONAL en el snapshot que suma
+    varias; solo este trae `por_delegacion`, con el resumen de cada una.
+
+    `filtros` resuelve los filtros de la pestaña Plazas sobre `df` y `huella`
+    resume su contenido (clave de los reportes cacheados).
+    `tarjetas` es el HTML de la tarjeta de cada fila de `df` y `cambios`, los
+    ultimos CAMBIOS_MAX cambios de plazas, del mas viejo al mas nuevo, como
+    tuplas (hora, zona, especialidad, def. antes, def. despues, int. antes,
+    int. despues) con las disponibles; None del lado que no existe en altas y bajas.
+    """
+    df: pd.DataFrame
+    config: dict
+    indice: dict
+    version: str
+    plazas_cargadas_en: float
+    agregados: Agregados
+    busqueda: IndiceBusqueda
+    eventos: pd.DataFrame
+    cursor_eventos: int
+    tabla_leida_en: float
+    copia_local: bool = False
+    delegacion: str = DELEGACION
+    por_delegacion: pd.DataFrame = None
+    tarjetas: pd.Series = None
+    cambios: tuple = ()
+    filtros: IndiceFiltros = None
+    huella: str = ""
+
+
+def huella_datos(df):
+    """Resumen del contenido de `df`: cambia con cualquier edicion, aunque no cambie la version."""
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+
+def construir_snapshot(df, config, indice, version, leido_en, eventos, cursor_eventos, delegacion=DELEGACION):
+    """Arma el snapshot con todas sus tablas derivadas, sin uno anterior con que compararlo."""
+    agregados = calcular_agregados(df)
+    return Snapshot(df, config, indice, version, leido_en, agregados, IndiceBusqueda(agregados.por_especialidad.index),
+                    eventos, cursor_eventos, leido_en, delegacion=delegacion, tarjetas=html_tarjetas(df),
+                    filtros=IndiceFiltros(df), huella=huella_datos(df))
+
+
+def _mismas_llaves(a, b):
+    """True si dos columnas de llave tienen los mismos valores en el mismo orden."""
+    if (isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype)
+            and a.cat.categories.equals(b.cat.categories)):
+        return np.array_equal(a.cat.codes.to_numpy(), b.cat.codes.to_numpy())
+    return np.array_equal(a.astype(str).to_numpy(), b.astype(str).to_numpy())
+
+
+def diferencias(viejo, nuevo):
+    """Plazas que cambiaron entre dos `df` de snapshot, comparadas por (zona, especialidad).
+
+    Retorna (filas, cambios). Si ambos tienen las mismas plazas en el mismo
+    orden, `filas` son las posiciones que cambiaron algun conteo; si no (altas
+    o bajas), es None. `cambios` trae zona, especialidad y las disponibles
+    antes y despues, NaN del lado que no existe.
+    """
+    conteos = ["def_total", "int_total", "def_tomadas", "int_tomadas"]
+    if (len(viejo) == len(nuevo) and _mismas_llaves(viejo["zona"], nuevo["zona"])
+            and _mismas_llaves(viejo["especialidad"], nuevo["especialidad"])):
+        filas = np.flatnonzero((viejo[conteos].to_numpy() != nuevo[conteos].to_numpy()).any(axis=1))
+        antes, despues = viejo.iloc[filas], nuevo.iloc[filas]
+        return filas, pd.DataFrame({
+            "zona": despues["zona"].astype(str).to_numpy(),
+            "especialidad": despues["especialidad"].astype(str).to_numpy(),
+            "def_antes": antes["def_disp"].to_numpy(), "def_despues": despues["def_disp"].to_numpy(),
+            "int_antes": antes["int_disp"].to_numpy(), "int_despues": despues["int_disp"].to_numpy(),
+        })
+
+    columnas = ["zona", "especialidad", "def_disp", "int_disp", *conteos]
+    llaves = {"zona": str, "especialidad": str}
+    unidas = viejo[columnas].astype(llaves).merge(nuevo[columnas].astype(llaves), on=["zona", "especialidad"],
+                                                  how="outer", suffixes=("_antes", "_despues"))
+    # NaN != NaN: las altas y bajas cuentan como cambio
+    cambio = (unidas[[f"{c}_antes" for c in conteos]].to_numpy()
+              != unidas[[f"{c}_despues" for c in conteos]].to_numpy()).any(axis=1)
+    unidas = unidas[cambio]
+    return None, pd.DataFrame({
+        "zona": unidas["zona"].to_numpy(), "especialidad": unidas["especialidad"].to_numpy(),
+        "def_antes": unidas["def_disp_antes"].to_numpy(), "def_despues": unidas["def_disp_despues"].to_numpy(),
+        "int_antes": unidas["int_disp_antes"].to_numpy(), "int_despues": unidas["int_disp_despues"].to_numpy(),
+    })
+
+
+def derivar_snapshot(anterior, df, leido_en, cambios_en=None, **campos):
+    """Snapshot con las plazas `df` que recalcula solo lo que cambio respecto de `anterior`.
+
+    Con las mismas plazas en el mismo orden (lo normal: solo cambian conteos)
+    los agregados y las tarjetas se ajustan en las filas que cambiaron y se
+    conservan el indice de busqueda y los mapas de zona de los filtros; con
+    altas o bajas se arma todo de nuevo.
+    Los cambios se suman a `cambios` con la hora `cambios_en` (por omision,
+    `leido_en`). `campos` fija el resto de los campos (config, indice, version,
+    eventos, ...).
+    """
+    filas, cambios = diferencias(anterior.df, df)
+    if filas is None:
+        base = construir_snapshot(df, anterior.config, anterior.indice, anterior.version, leido_en,
+                                  anterior.eventos, anterior.cursor_eventos, anterior.delegacion)
+        nuevo = replace(base, **{"por_delegacion": anterior.por_delegacion, **campos})
+    else:
+        agregados, tarjetas, filtros, huella = anterior.agregados, anterior.tarjetas, anterior.filtros, anterior.huella
+        if len(filas):
+            huella = huella_datos(df)
+            agregados = actualizar_agregados(agregados, anterior.df, df, filas)
+            tarjetas = tarjetas.copy()
+            tarjetas.iloc[filas] = html_tarjetas(df.iloc[filas]).to_numpy()
+            filtros = filtros.con_conteos(df)
+        nuevo = replace(anterior, **{"df": df, "agregados": agregados, "tarjetas": tarjetas, "filtros": filtros,
+                                     "huella": huella, "plazas_cargadas_en": leido_en, "copia_local": False, **campos})
+
+    # Una recarga que cambia mas plazas de las que caben (la primera lectura de una
+    # delegacion, una hoja reemplazada) no se lista: solo desplazaria los cambios reales
+    if filas is None and len(cambios) > CAMBIOS_MAX:
+        return replace(nuevo, cambios=anterior.cambios)
+    registro = tuple(
+        (cambios_en or leido_en, zona, especialidad, *(None if pd.isna(v) else int(v) for v in valores))
+        for zona, especialidad, *valores in cambios.itertuples(index=False)
+    )
+    return replace(nuevo, cambios=(anterior.cambios + registro)[-CAMBIOS_MAX:]) if registro else nuevo
+
+
+def combinar_snapshots(particiones, anterior=None):
+    """Snapshot nacional a partir de los de cada delegacion ({nombre: Snapshot}).
+
+    Las plazas se concatenan con la columna `delegacion` y la zona calificada
+    ("Delegacion · HGZ 1"), asi las zonas de igual nombre en distintas
+    delegaciones no se mezclan y las pestañas funcionan sin cambios. No lleva
+    indice ni bitacora: los guardados se hacen en la vista de cada delegacion.
+    Con el nacional `anterior` solo se recalculan las plazas que cambiaron.
+    """
+    nombres = list(particiones)
+    df = pd.concat([
+        s.df.assign(zona=f"{nombre} · " + s.df["zona"].astype(str), especialidad=s.df["especialidad"].astype(str))
+        for nombre, s in particiones.items()
+    ], ignore_index=True)
+    df["zona"] = df["zona"].astype("category")
+    df["especialidad"] = df["especialidad"].astype("category")
+    df["delegacion"] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(nombres)), [len(s.df) for s in particiones.values()]), categories=nombres)
+
+    por_delegacion = pd.DataFrame([
+        {**s.agregados.por_zona[["disp", "tom", "tot", "n_disp"]].sum().to_dict(), "zonas": len(s.agregados.por_zona)}
+        for s in particiones.values()
+    ], index=pd.Index(nombres, name="delegacion")).astype("int64")
+    # Dia del evento mas avanzado y la actualizacion de la delegacion con datos mas recientes
+    reciente = max(particiones.values(), key=lambda s: s.plazas_cargadas_en)
+    config = {
+        "dia_evento": max(int(s.config.get("dia_evento", 1)) for s in particiones.values()),
+        "ultima_actualizacion": reciente.config.get("ultima_actualizacion", "Sin actualizaciones aun"),
+    }
+    version = "|".join(f"{nombre}={s.version}" for nombre, s in particiones.items())
+    # Los datos nacionales son tan recientes como la delegacion mas atrasada
+    leido_en = min(s.plazas_cargadas_en for s in particiones.values())
+    campos = {"config": config, "version": version, "por_delegacion": por_delegacion,
+              "copia_local": any(s.copia_local for s in particiones.values())}
+    if anterior is None or anterior.por_delegacion is None:
+        snapshot = construir_snapshot(df, config, None, version, leido_en, eventos_a_df([]), 0, delegacion=NACIONAL)
+        return replace(snapshot, **campos)
+    # Los cambios llevan la hora en que se combinan, no la de la delegacion mas atrasada
+    return derivar_snapshot(anterior, df, leido_en, time.time(), **campos)
+
+
+def acumular_eventos(eventos, filas):
+    """Bitacora del snapshot mas las filas nuevas, con tipos compactos."""
+    nuevos = eventos_a_df(filas)
+    if eventos is None or eventos.empty:
+        return nuevos
+    if nuevos.empty:
+        return eventos
+    todos = pd.concat([eventos, nuevos], ignore_index=True)
+    for col in ["zona", "especialidad", "tipo", "operador"]:
+        todos[col] = todos[col].astype(str).astype("category")
+    return todos
+
+
+def aplicar_eventos(snapshot, nuevos):
+    """Plazas del snapshot con los eventos aplicados, sin releer la tabla.
+
+    Cada evento fija el total tomado de su plaza (idempotente). Retorna None si
+    alguno corresponde a una plaza que el snapshot no tiene (hace falta recargar).
+    """
+    nuevos = nuevos[nuevos["tipo"].isin(["def", "int"])]
+    filas = [snapshot.agregados.posicion.get(k)
+             for k in zip(nuevos["zona"].astype(str), nuevos["especialidad"].astype(str))]
+    if any(f is None for f in filas):
+        return None
+    if not filas:
+        return snapshot.df
+
+    ultimos = nuevos.assign(fila=filas).drop_duplicates(["fila", "tipo"], keep="last")
+    tomadas = {t: snapshot.df[f"{t}_tomadas"].to_numpy().copy() for t in ("def", "int")}
+    for tipo, grupo in ultimos.groupby("tipo", observed=True):
+        tomadas[tipo][grupo["fila"].to_numpy()] = grupo["valor"].to_numpy()
+    df = snapshot.df.assign(def_tomadas=tomadas["def"], int_tomadas=tomadas["int"])
+    df = df.assign(def_disp=df["def_total"] - df["def_tomadas"], int_disp=df["int_total"] - df["int_tomadas"])
+    df["total_disp"] = df["def_disp"] + df["int_disp"]
+    return df